@@ -1,264 +1,146 @@
 import os
+import json
+import time
 import base64
-import cv2
+import logging
 import numpy as np
-# Try to import face_recognition, but make it optional
-try:
-    import face_recognition
-    FACE_RECOGNITION_AVAILABLE = True
-except ImportError:
-    print("Warning: face_recognition module not available. Facial recognition features will be disabled.")
-    FACE_RECOGNITION_AVAILABLE = False
-    
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context, g
 from flask_cors import CORS
 from PIL import Image
-import pytesseract
-from io import BytesIO
 import re
 
+from ocr_engine import run_ocr, ocr_pool, OCRPoolBusy
+from result_cache import result_cache, make_key
+from id_layout import process_card_layout
+from face_detection import (FACE_RECOGNITION_AVAILABLE, detect_faces, parse_detection_options, options_signature,
+                            parse_response_options, response_signature, annotate_faces, rescale_box)
+from face_matching import get_face_encoding, compare_faces, FACE_MATCH_TOLERANCE
+from similarity import similarity_score
+from field_extractor import EXTRACTORS
+from preprocessing import OCR_PREPROCESS, parse_pipeline, pipeline_signature, apply_pipeline
+from db_config import hash_image, get_face_index
+from jobs import JobQueue, QueueFull, PRIORITIES
+from image_io import decode_image, upload_scale, ImageDecodeError
+from quality import assess_quality, rejection, QUALITY_GATE_ENABLED, FACIAL_CHECKS
+from archiver import upload_archiver
+from persistence import verification_writer
+from purge import purger, start_scheduler, PURGE_IN_PROCESS
+from metrics import (stage, begin_request, end_request, current_trace, wants_server_timing, observe_request,
+                     register_collector, render as render_metrics, REQUESTS_IN_FLIGHT)
+from face_tracking import face_sessions, SessionLimit, FACE_STREAM_MAX_FRAMES
+from batch_verification import BatchError, BATCH_MAX_ITEMS, parse_multipart_batch, parse_zip_batch, run_batch
+
+# Set LOG_LEVEL=DEBUG to log the raw OCR text of every request
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO'))
+
 app = Flask(__name__)
-CORS(app)
+# Expose Server-Timing so the browser client can read the per-stage breakdown
+CORS(app, expose_headers=['Server-Timing'])
+
+def expire_face_index():
+    """Drop expired encodings from this process's face index.
+    
+    The index lives in the serving process, so this runs here even when purge.py
+    deletes the records (PURGE_IN_PROCESS=false).
+    """
+    get_face_index().expire()
+
+def start_background_jobs():
+    """Delete expired verification records and face encodings in the background.
+    
+    Called by serving processes only, never at import: batch workers, benchmark.py and
+    the debug reloader's watcher process all import this module too.
+    """
+    start_scheduler(purge_records=PURGE_IN_PROCESS, jobs={'expire_face_index': expire_face_index})
+
+@app.before_request
+def ensure_background_jobs():
+    # Any WSGI server: the first request starts the scheduler; later calls are no-ops
+    start_background_jobs()
+
+# Request metrics for /metrics, and a Server-Timing breakdown for clients that ask for one
+@app.before_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    g.metrics_token = begin_request(wants_server_timing(request.headers))
+    REQUESTS_IN_FLIGHT.inc(g.metrics_endpoint)
 
-# Configure upload folder
-UPLOAD_FOLDER = 'uploads'
-if not os.path.exists(UPLOAD_FOLDER):
-    os.makedirs(UPLOAD_FOLDER)
+@app.after_request
+def finish_request_metrics(response):
+    if 'metrics_started' not in g:
+        return response
+    elapsed = time.perf_counter() - g.metrics_started
+    observe_request(g.metrics_endpoint, request.method, response.status_code, elapsed)
+    trace = current_trace()
+    if trace is not None and trace.server_timing:
+        response.headers['Server-Timing'] = trace.server_timing_header(elapsed)
+    return response
+
+@app.teardown_request
+def end_request_metrics(exc):
+    if 'metrics_token' in g:
+        REQUESTS_IN_FLIGHT.dec(g.metrics_endpoint)
+        end_request(g.pop('metrics_token'))
+
+# Default OCR layout mode: 'full' page analysis or 'ghana_card' field zones
+OCR_LAYOUT = os.getenv('OCR_LAYOUT', 'full')
+OCR_LAYOUTS = ('full', 'ghana_card')
 
 # Remove duplicate imports
 # import cv2
 # import numpy as np
 # from io import BytesIO
 
-def process_ocr(image):
+def process_ocr(image, layout='full', preprocess_steps=None, document_type='ghana_card'):
     try:
+        # Clean up the image before OCR (downscale, grayscale, threshold, ...)
+        if preprocess_steps:
+            with stage('preprocess'):
+                image = apply_pipeline(image, preprocess_steps)
+        
+        # In card layout mode only the known field zones are OCR'd
+        if layout == 'ghana_card':
+            card_image = image if isinstance(image, np.ndarray) else np.asarray(image.convert('RGB'))
+            with stage('ocr_layout'):
+                layout_result = process_card_layout(card_image)
+            if layout_result and any(layout_result['extracted'].values()):
+                layout_result['layout'] = layout
+                return {'success': True, 'data': layout_result}
+        
         # Convert to PIL Image if needed
         if isinstance(image, np.ndarray):
             image = Image.fromarray(image)
         
-        # Extract text using Tesseract with improved configuration
-        text = pytesseract.image_to_string(image, config='--psm 3')
-        
-        # For debugging: Get detailed OCR data with confidence scores
-        ocr_data = pytesseract.image_to_data(image, output_type=pytesseract.Output.DICT)
-        
-        # Filter out low-confidence text
-        filtered_text = []
-        for i in range(len(ocr_data['text'])):
-            if int(ocr_data['conf'][i]) > 60 and ocr_data['text'][i].strip():  # Only keep text with confidence > 60%
-                filtered_text.append(ocr_data['text'][i])
+        # Run Tesseract once and derive the full text, filtered text and confidences from it
+        with stage('ocr_tesseract'):
+            ocr_result = run_ocr(image, psm=3)
+        text = ocr_result['text']
         
         # Extract structured data from the OCR text
-        extracted_data = extract_id_card_data(text)
+        with stage('extract'):
+            extracted_data = extract_id_card_data(text, document_type)
         
         return {
             'success': True, 
             'data': {
                 'text': text,
-                'filtered_text': ' '.join(filtered_text),
+                'filtered_text': ocr_result['filtered_text'],
                 'extracted': extracted_data,
-                'confidence': ocr_data['conf']
+                'confidence': ocr_result['confidence']
             }
         }
+    except OCRPoolBusy:
+        raise
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
-def extract_id_card_data(text):
-    """Extract structured data from OCR text with improved patterns for Ghana IDs"""
-    data = {
-        'firstName': None,
-        'lastName': None,
-        'id_number': None,
-        'nationality': None,
-        'sex': None  # Added sex/gender field
-    }
-    
-    # Print the raw OCR text for debugging
-    print("Raw OCR Text:")
-    print(text)
-    print("-" * 50)
-    
-    # Split text into lines for better processing
-    text_lines = [line.strip() for line in text.split('\n') if line.strip()]
-    
-    # Print the lines for debugging
-    print("Text lines:")
-    for i, line in enumerate(text_lines):
-        print(f"{i}: {line}")
-    print("-" * 50)
-    
-    # Generic pattern for last name (all uppercase words)
-    for line in text_lines:
-        # Look for standalone uppercase words that might be last names
-        if re.match(r'^[A-Z]+$', line) and len(line) > 1:
-            data['lastName'] = line
-            break
-    
-    # Generic pattern for first name
-    for i, line in enumerate(text_lines):
-        # Look for lines containing uppercase words that might be first names
-        if re.match(r'^[A-Z]+(\s[A-Z]+)*$', line) and len(line) > 1:
-            # Skip if this is the same as the last name
-            if line != data['lastName']:
-                # Extract the first name - take the first word if multiple words
-                name_parts = line.split()
-                if name_parts:
-                    data['firstName'] = name_parts[0]
-                break
-    
-    # If still no first name, look for lines after "FirstnamesiPrénoms" or similar labels
-    if not data['firstName']:
-        name_labels = ['Firstname', 'Prénoms', 'First name', 'Given name', 'Name']
-        for i, line in enumerate(text_lines):
-            if any(label in line for label in name_labels):
-                # Check the next line(s)
-                for j in range(i+1, min(i+3, len(text_lines))):
-                    if j < len(text_lines) and re.match(r'^[A-Z]+(\s[A-Z]+)*$', text_lines[j]) and len(text_lines[j]) > 1:
-                        # This might be the name line
-                        name_parts = text_lines[j].split()
-                        if name_parts:
-                            data['firstName'] = name_parts[0]
-                        break
-                if data['firstName']:
-                    break
-    
-    # Extract ID number - look for GHA pattern or other ID patterns
-    id_patterns = [
-        r'(GHA[-\s]?\d+[-\s]?\d*)',  # Ghana ID pattern
-        r'(ID[-\s:]?\d+[-\s]?\d*)',  # Generic ID pattern
-        r'(\d{9,})'                  # Any sequence of 9+ digits might be an ID
-    ]
-    
-    for line in text_lines:
-        for pattern in id_patterns:
-            id_match = re.search(pattern, line)
-            if id_match:
-                data['id_number'] = id_match.group(1).replace(' ', '')
-                break
-        if data['id_number']:
-            break
-    
-    # Extract nationality - look for common nationality indicators
-    nationality_labels = ['Nationality', 'Nation', 'Citizen', 'Citizenship']
-    
-    # First try to find lines with nationality labels
-    for i, line in enumerate(text_lines):
-        if any(label.lower() in line.lower() for label in nationality_labels):
-            # Check if "Ghanaian" is on the same line
-            if 'ghanaian' in line.lower():
-                data['nationality'] = 'Ghanaian'
-                break
-            elif 'ghana' in line.lower():
-                data['nationality'] = 'Ghanaian'  # Convert Ghana to Ghanaian
-                break
-            
-            # If not found on the same line, check the next line
-            if not data['nationality'] and i+1 < len(text_lines):
-                next_line = text_lines[i+1].lower()
-                if 'ghanaian' in next_line:
-                    data['nationality'] = 'Ghanaian'
-                    break
-                elif 'ghana' in next_line:
-                    data['nationality'] = 'Ghanaian'  # Convert Ghana to Ghanaian
-                    break
-            
-            # If still not found, look for any capitalized word in the next line
-            if not data['nationality'] and i+1 < len(text_lines):
-                next_line = text_lines[i+1]
-                # Look for capitalized words that might be nationalities
-                words = next_line.split()
-                for word in words:
-                    if word[0].isupper() and len(word) > 2 and word.lower() not in ['the', 'and', 'for', 'with']:
-                        # If the word is Ghana, convert to Ghanaian
-                        if word.lower() == 'ghana':
-                            data['nationality'] = 'Ghanaian'
-                        else:
-                            data['nationality'] = word
-                        break
-            
-            if data['nationality']:
-                break
-    
-    # If still not found, look for common nationalities in all lines
-    if not data['nationality']:
-        for line in text_lines:
-            line_lower = line.lower()
-            if 'ghanaian' in line_lower:
-                data['nationality'] = 'Ghanaian'
-                break
-            elif 'ghana' in line_lower and 'ghanaian' not in line_lower:
-                data['nationality'] = 'Ghanaian'  # Convert Ghana to Ghanaian
-                break
-    
-    # Extract sex/gender - look for common gender indicators
-    gender_labels = ['Sex', 'Gender', 'Male', 'Female', 'M', 'F']
-    
-    # First try to find lines with gender labels
-    for i, line in enumerate(text_lines):
-        line_lower = line.lower()
-        
-        # Check for gender label followed by value
-        if any(label.lower() in line_lower for label in gender_labels[:2]):  # Sex or Gender
-            # Check if gender is on the same line
-            if 'male' in line_lower and 'female' not in line_lower:
-                data['sex'] = 'Male'
-                break
-            elif 'female' in line_lower:
-                data['sex'] = 'Female'
-                break
-            elif ' m ' in f' {line_lower} ' or line_lower.endswith(' m'):
-                data['sex'] = 'Male'
-                break
-            elif ' f ' in f' {line_lower} ' or line_lower.endswith(' f'):
-                data['sex'] = 'Female'
-                break
-            
-            # If not found on the same line, check the next line
-            if not data['sex'] and i+1 < len(text_lines):
-                next_line = text_lines[i+1].lower()
-                if 'male' in next_line and 'female' not in next_line:
-                    data['sex'] = 'Male'
-                    break
-                elif 'female' in next_line:
-                    data['sex'] = 'Female'
-                    break
-                elif next_line.strip() == 'm':
-                    data['sex'] = 'Male'
-                    break
-                elif next_line.strip() == 'f':
-                    data['sex'] = 'Female'
-                    break
-        
-        # Direct gender indicators
-        elif line_lower.strip() == 'male' or line_lower.strip() == 'm':
-            data['sex'] = 'Male'
-            break
-        elif line_lower.strip() == 'female' or line_lower.strip() == 'f':
-            data['sex'] = 'Female'
-            break
-    
-    # If still not found, look for gender indicators in all lines
-    if not data['sex']:
-        for line in text_lines:
-            line_lower = line.lower()
-            # Look for standalone gender indicators
-            if re.search(r'\bmale\b', line_lower) and not re.search(r'\bfemale\b', line_lower):
-                data['sex'] = 'Male'
-                break
-            elif re.search(r'\bfemale\b', line_lower):
-                data['sex'] = 'Female'
-                break
-            # Look for M/F indicators with word boundaries
-            elif re.search(r'\bm\b', line_lower) and not re.search(r'\bf\b', line_lower):
-                data['sex'] = 'Male'
-                break
-            elif re.search(r'\bf\b', line_lower):
-                data['sex'] = 'Female'
-                break
-    
-    return data
-
-def process_facial(image):
+def extract_id_card_data(text, document_type='ghana_card'):
+    """Extract structured data from OCR text with the field rules for the document type"""
+    return EXTRACTORS[document_type].extract(text)
+
+def process_facial(image, detection_options=None, response_options=None, source_scale=1.0):
+    """Detect faces; boxes are reported in the uploaded image's pixels, source_scale times the decoded array's"""
     try:
         # Check if face_recognition is available
         if not FACE_RECOGNITION_AVAILABLE:
@@ -267,61 +149,154 @@ def process_facial(image):
                 'error': 'Face recognition module is not installed. Please install it with: pip install face-recognition'
             }
             
-        # Convert PIL Image to numpy array if needed
+        # Convert PIL Image to an RGB numpy array if needed
         if isinstance(image, Image.Image):
-            image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
+            image = np.asarray(image.convert('RGB'))
         
-        # Find face locations
-        face_locations = face_recognition.face_locations(image)
+        # Find face locations on a downscaled copy, mapped back to full resolution
+        with stage('face_detect'):
+            face_locations, detection_info = detect_faces(image, **(detection_options or {}))
         
-        # Draw rectangles around faces
-        for top, right, bottom, left in face_locations:
-            cv2.rectangle(image, (left, top), (right, bottom), (0, 255, 0), 2)
+        # Large uploads are decoded at reduced size; report boxes at the size that was uploaded
+        height, width = image.shape[:2]
+        upload_width, upload_height = int(round(width * source_scale)), int(round(height * source_scale))
+        data = {
+            'boxes': [
+                {'top': top, 'right': right, 'bottom': bottom, 'left': left}
+                for top, right, bottom, left in (
+                    rescale_box(box, source_scale, upload_width, upload_height) for box in face_locations
+                )
+            ],
+            'image_size': {'width': upload_width, 'height': upload_height},
+            'faces_found': len(face_locations),
+            'detection': detection_info
+        }
         
-        # Convert the image to base64
-        _, buffer = cv2.imencode('.jpg', image)
-        image_base64 = base64.b64encode(buffer).decode('utf-8')
+        # Boxes-only responses skip drawing and JPEG encoding altogether
+        response_options = response_options or parse_response_options({})
+        if response_options['format'] != 'boxes':
+            with stage('face_annotate'):
+                jpeg = annotate_faces(image, face_locations, response_options['thumbnail_size'], response_options['quality'])
+            # Raw bytes; only the JSON 'image' format base64-encodes them (json_result)
+            data['image'] = jpeg
         
-        return {
-            'success': True,
-            'data': {
-                'image': image_base64,
-                'faces_found': len(face_locations)
-            }
-        }
+        return {'success': True, 'data': data}
     except Exception as e:
         return {'success': False, 'error': str(e)}
 
-def similarity_score(str1, str2):
-    """Improved string similarity score between 0 and 1 using Levenshtein distance"""
-    if not str1 or not str2:
-        return 0
+def parse_processing_options(form):
+    """Read /process-image options from a request form, raising ValueError on bad input"""
+    layout = form.get('layout', OCR_LAYOUT)
+    if layout not in OCR_LAYOUTS:
+        raise ValueError(f'Unsupported layout: {layout}')
+    document_type = form.get('document_type', 'ghana_card')
+    if document_type not in EXTRACTORS:
+        raise ValueError(f'Unsupported document type: {document_type}')
     
-    # Simple Levenshtein distance implementation
-    m, n = len(str1), len(str2)
-    d = [[0 for _ in range(n+1)] for _ in range(m+1)]
+    return {
+        'type': 'ocr' if form.get('type', 'ocr') == 'ocr' else 'facial',
+        'encode_portrait': str(form.get('encode_portrait', '')).lower() in ('1', 'true', 'yes'),
+        'layout': layout,
+        'document_type': document_type,
+        'preprocess_steps': parse_pipeline(form.get('preprocess', OCR_PREPROCESS)),
+        'detection_options': parse_detection_options(form),
+        'response_options': parse_response_options(form)
+    }
+
+def multipart_response_body(result):
+    """Split a facial result into a multipart/mixed body: the JSON without the image, then the raw JPEG.
     
-    for i in range(m+1):
-        d[i][0] = i
-    for j in range(n+1):
-        d[0][j] = j
+    Returns (body, content_type).
+    """
+    data = dict(result['data'])
+    jpeg = data.pop('image')
+    boundary = os.urandom(12).hex()
+    body = b''.join([
+        f'--{boundary}\r\nContent-Type: application/json\r\n\r\n'.encode(),
+        json.dumps(dict(result, data=data)).encode(),
+        f'\r\n--{boundary}\r\nContent-Type: image/jpeg\r\nContent-Length: {len(jpeg)}\r\n\r\n'.encode(),
+        jpeg,
+        f'\r\n--{boundary}--\r\n'.encode()
+    ])
+    return body, f'multipart/mixed; boundary={boundary}'
+
+def json_result(result):
+    """The result ready for a JSON response, with a facial result's raw JPEG as base64"""
+    data = result.get('data')
+    if not isinstance(data, dict) or not isinstance(data.get('image'), bytes):
+        return result
+    return dict(result, data=dict(data, image=base64.b64encode(data['image']).decode('ascii')))
+
+def wants_multipart(options, result):
+    return options['type'] == 'facial' and options['response_options']['format'] == 'multipart' \
+        and result.get('success') and 'image' in result['data']
+
+def cache_portrait_encoding(image_hash, load_image):
+    """Cache the ID card portrait's face encoding under the card's hash.
     
-    for j in range(1, n+1):
-        for i in range(1, m+1):
-            if str1[i-1] == str2[j-1]:
-                d[i][j] = d[i-1][j-1]
-            else:
-                d[i][j] = min(
-                    d[i-1][j] + 1,    # deletion
-                    d[i][j-1] + 1,    # insertion
-                    d[i-1][j-1] + 1   # substitution
-                )
+    /match-faces then takes 'id_card_hash' instead of a second upload of the card.
+    A failure here only costs the client that upload, so it does not fail the OCR.
+    """
+    if not FACE_RECOGNITION_AVAILABLE:
+        return
+    try:
+        with stage('face_encoding'):
+            get_face_encoding(image_hash, load_image)
+    except Exception as e:
+        print(f"Warning: caching the ID portrait encoding failed: {e}")
+
+def run_processing(image_bytes, options):
+    """Run OCR or face detection on uploaded image bytes, reusing cached results for repeat uploads"""
+    processing_type = options['type']
+    
+    # Repeat uploads of the same image reuse the earlier result
+    if processing_type == 'ocr':
+        variant = f"{options['layout']}|{options['document_type']}|{pipeline_signature(options['preprocess_steps'])}"
+    else:
+        variant = f"{options_signature(options['detection_options'])}|{response_signature(options['response_options'])}"
+    with stage('cache_lookup'):
+        image_hash = hash_image(image_bytes)
+        cache_key = make_key(image_hash, processing_type, variant=variant)
+        cached_result = result_cache.get(cache_key)
+    if cached_result is not None:
+        # The encoding is cached separately; the card is only decoded if it has expired
+        if processing_type == 'ocr' and options['encode_portrait']:
+            cache_portrait_encoding(image_hash, lambda: decode_image(image_bytes))
+        return cached_result
+    
+    # Keep a copy of the upload if archiving is enabled; written by a background thread
+    upload_archiver.archive(image_bytes, image_hash)
+    
+    # Decode once, straight from the request buffer, into an RGB array
+    with stage('decode'):
+        image = decode_image(image_bytes)
+    
+    # Blurry, glare-washed or tiny photos are turned away before the expensive stages
+    quality = None
+    if QUALITY_GATE_ENABLED:
+        with stage('quality'):
+            quality = assess_quality(image, checks=None if processing_type == 'ocr' else FACIAL_CHECKS)
+        if not quality['passed']:
+            return rejection(quality)
     
-    # Convert Levenshtein distance to similarity score (0 to 1)
-    max_len = max(m, n)
-    if max_len == 0:
-        return 1.0  # Both strings are empty
-    return 1.0 - (d[m][n] / max_len)
+    if processing_type == 'ocr':
+        if options['encode_portrait']:
+            cache_portrait_encoding(image_hash, lambda: image)
+        result = process_ocr(image, layout=options['layout'], preprocess_steps=options['preprocess_steps'],
+                             document_type=options['document_type'])
+    else:
+        result = process_facial(image, detection_options=options['detection_options'],
+                                response_options=options['response_options'],
+                                source_scale=upload_scale(image_bytes, image))
+    
+    if quality is not None:
+        result['quality'] = quality
+    # Lets the client refer to this image again, e.g. as /match-faces' id_card_hash
+    result['image_hash'] = image_hash
+    if result.get('success'):
+        result_cache.set(cache_key, result)
+    
+    return result
 
 @app.route('/process-image', methods=['POST'])
 def process_image():
@@ -332,26 +307,285 @@ def process_image():
     if file.filename == '':
         return jsonify({'success': False, 'error': 'No selected file'}), 400
     
-    processing_type = request.form.get('type', 'ocr')
+    try:
+        options = parse_processing_options(request.form)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     
     try:
         # Read and process the image
         image_bytes = file.read()
-        image = Image.open(BytesIO(image_bytes))
+        result = run_processing(image_bytes, options)
+        if result.get('rejected'):
+            return jsonify(result), 422
+        
+        if wants_multipart(options, result):
+            body, content_type = multipart_response_body(result)
+            return Response(body, content_type=content_type)
+        return jsonify(json_result(result))
+    except ImageDecodeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except OCRPoolBusy as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def run_job(payload):
+    """Job handler: the same processing as /process-image, from a queued payload"""
+    token = begin_request()
+    try:
+        options = parse_processing_options(payload['form'])
+        return json_result(run_processing(base64.b64decode(payload['image']), options))
+    finally:
+        end_request(token)
+
+job_queue = JobQueue(run_job)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue an image for processing and return a job id straight away"""
+    if 'image' not in request.files:
+        return jsonify({'success': False, 'error': 'No image file provided'}), 400
+    
+    file = request.files['image']
+    if file.filename == '':
+        return jsonify({'success': False, 'error': 'No selected file'}), 400
+    
+    priority = request.form.get('priority', 'interactive')
+    if priority not in PRIORITIES:
+        return jsonify({'success': False, 'error': f'Unsupported priority: {priority}'}), 400
+    
+    # Validate options now so bad requests fail fast instead of as failed jobs
+    try:
+        parse_processing_options(request.form)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    payload = {
+        'image': base64.b64encode(file.read()).decode('ascii'),
+        'form': {key: request.form[key] for key in request.form if key not in ('priority', 'callback_url')}
+    }
+    try:
+        job_id = job_queue.submit(payload, priority=priority, callback_url=request.form.get('callback_url'))
+    except QueueFull as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    
+    return jsonify({'success': True, 'data': {'job_id': job_id, 'status': 'queued'}}), 202
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Job status and result; ?wait=<seconds> long-polls until the job finishes"""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        return jsonify({'success': False, 'error': 'wait must be a number of seconds'}), 400
+    
+    job = job_queue.get(job_id, wait=wait)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown job id'}), 404
+    
+    job.pop('callback_url', None)
+    return jsonify({'success': True, 'data': job})
+
+@app.route('/jobs/stats', methods=['GET'])
+def job_stats():
+    return jsonify({'success': True, 'data': job_queue.stats()})
+
+@app.route('/match-faces', methods=['POST'])
+def match_faces():
+    """Compare the portrait on an ID card with a selfie.
+    
+    Each image is sent either as a file ('id_card', 'selfie') or, when it was matched
+    before, as the hash returned by an earlier call ('id_card_hash', 'selfie_hash'). An
+    OCR request with 'encode_portrait' also makes its image_hash usable as id_card_hash.
+    """
+    if not FACE_RECOGNITION_AVAILABLE:
+        return jsonify({
+            'success': False,
+            'error': 'Face recognition module is not installed. Please install it with: pip install face-recognition'
+        })
+    
+    try:
+        detection_options = parse_detection_options(request.form)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        encodings = {}
+        faces_found = {}
+        hashes = {}
+        for role, label in (('id_card', 'ID card'), ('selfie', 'selfie')):
+            file = request.files.get(role)
+            load_image = None
+            if file and file.filename:
+                image_bytes = file.read()
+                image_hash = hash_image(image_bytes)
+                load_image = lambda data=image_bytes: decode_image(data)
+            else:
+                image_hash = request.form.get(f'{role}_hash')
+                if not image_hash:
+                    return jsonify({'success': False, 'error': f'No {label} image provided'}), 400
+            
+            with stage('face_encoding'):
+                result = get_face_encoding(image_hash, load_image, detection_options)
+            if result is None:
+                return jsonify({'success': False, 'error': f'Unknown {role}_hash, please upload the {label} image'}), 404
+            
+            encoding, faces_found[role] = result
+            if encoding is None:
+                return jsonify({'success': False, 'error': f'No face found in the {label}'})
+            encodings[role] = encoding
+            hashes[role] = image_hash
         
-        # Save a copy of the uploaded image for debugging if needed
-        save_path = os.path.join(UPLOAD_FOLDER, f"upload_{processing_type}_{os.urandom(4).hex()}.jpg")
-        image.save(save_path)
+        with stage('face_compare'):
+            comparison = compare_faces(encodings['id_card'], encodings['selfie'])
+        comparison['faces_found'] = faces_found
+        comparison['hashes'] = hashes
         
-        if processing_type == 'ocr':
-            result = process_ocr(image)
-        else:
-            result = process_facial(image)
+        # Earlier verifications with the same face may indicate one person under several IDs
+        comparison['duplicate_candidates'] = [
+            {'record_id': record_id, 'distance': round(distance, 4)}
+            for record_id, distance in get_face_index().search(encodings['selfie'], k=5, max_distance=FACE_MATCH_TOLERANCE)[0]
+        ]
         
-        return jsonify(result)
+        return jsonify({'success': True, 'data': comparison})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/face-stream', methods=['POST'])
+def start_face_stream():
+    """Open a camera session; frames are then posted to /face-stream/<session_id>/frames"""
+    if not FACE_RECOGNITION_AVAILABLE:
+        return jsonify({
+            'success': False,
+            'error': 'Face recognition module is not installed. Please install it with: pip install face-recognition'
+        })
+    
+    try:
+        detection_options = parse_detection_options(request.form)
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    try:
+        session = face_sessions.create(detection_options)
+    except SessionLimit as e:
+        return jsonify({'success': False, 'error': str(e)}), 503
+    
+    return jsonify({
+        'success': True,
+        'data': {'session_id': session.session_id, 'stable_frames': session.stable_frames}
+    }), 201
+
+def process_stream_frame(session, frame_bytes):
+    """Track the face in one camera frame; shared by the HTTP and WebSocket streams"""
+    if session.frames >= FACE_STREAM_MAX_FRAMES:
+        face_sessions.close(session.session_id)
+        return {'success': False, 'error': 'Frame limit reached for this session'}
+    
+    with stage('stream_frame'):
+        data = session.process_frame(decode_image(frame_bytes))
+    
+    # A finished session has nothing more to track
+    if data['done']:
+        face_sessions.close(session.session_id)
+    return {'success': True, 'data': data}
+
+@app.route('/face-stream/<session_id>/frames', methods=['POST'])
+def face_stream_frame(session_id):
+    """One low-res frame, either as a 'frame' file or as the raw request body"""
+    session = face_sessions.get(session_id)
+    if session is None:
+        return jsonify({'success': False, 'error': 'Unknown or expired session'}), 404
+    
+    file = request.files.get('frame')
+    frame_bytes = file.read() if file else request.get_data()
+    if not frame_bytes:
+        return jsonify({'success': False, 'error': 'No frame provided'}), 400
+    
+    try:
+        return jsonify(process_stream_frame(session, frame_bytes))
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/face-stream/<session_id>', methods=['DELETE'])
+def close_face_stream(session_id):
+    if face_sessions.close(session_id) is None:
+        return jsonify({'success': False, 'error': 'Unknown or expired session'}), 404
+    return jsonify({'success': True})
+
+@app.route('/face-stream/stats', methods=['GET'])
+def face_stream_stats():
+    return jsonify({'success': True, 'data': face_sessions.stats()})
+
+def record_batch_result(item, result, selfie_encoding):
+    """Persist a successful batch item the same way /verify-id-data does"""
+    if result['success']:
+        result['request_id'] = verification_writer.record(
+            item['form_data'], result['data_verification'],
+            id_card_hash=hash_image(item['id_card']), selfie_hash=hash_image(item['selfie']),
+            face_encoding=selfie_encoding
+        )
+
+@app.route('/verify-batch', methods=['POST'])
+def verify_batch():
+    """Verify many (id_card, selfie, form data) tuples and stream results back as NDJSON"""
+    try:
+        if 'batch' in request.files:
+            items = parse_zip_batch(request.files['batch'].read())
+        else:
+            items = parse_multipart_batch(request.files, request.form)
+    except BatchError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    if not items:
+        return jsonify({'success': False, 'error': 'No batch items provided'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'success': False, 'error': f'Batches are limited to {BATCH_MAX_ITEMS} items'}), 413
+    
+    return Response(stream_with_context(run_batch(items, on_result=record_batch_result)), mimetype='application/x-ndjson')
+
+@app.route('/ocr/stats', methods=['GET'])
+def ocr_stats():
+    return jsonify({'success': True, 'data': ocr_pool.stats()})
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    return jsonify({'success': True, 'data': result_cache.stats()})
+
+@app.route('/persistence/stats', methods=['GET'])
+def persistence_stats():
+    return jsonify({'success': True, 'data': verification_writer.stats()})
+
+def service_gauges():
+    """Pool, cache and queue gauges (and the cache's running totals) read at scrape time"""
+    ocr = ocr_pool.stats()
+    cache = result_cache.stats()
+    return [
+        ('verification_ocr_pool_busy', 'OCR workers currently running', ocr['busy']),
+        ('verification_ocr_pool_queued', 'OCR calls waiting for a worker', ocr['queued']),
+        ('verification_result_cache_hits_total', 'Result cache hits since start', cache['hits'], 'counter'),
+        ('verification_result_cache_misses_total', 'Result cache misses since start', cache['misses'], 'counter'),
+        ('verification_jobs_queued', 'Jobs waiting in the job queue', job_queue.stats()['queued']),
+        ('verification_records_pending', 'Verification records waiting to be written', verification_writer.stats()['pending'])
+    ]
+
+register_collector(service_gauges)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition of request, stage and pool metrics"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/purge/stats', methods=['GET'])
+def purge_stats():
+    return jsonify({'success': True, 'data': purger.stats()})
+
+@app.route('/archive/stats', methods=['GET'])
+def archive_stats():
+    return jsonify({'success': True, 'data': upload_archiver.stats()})
+
 @app.route('/verify-id-data', methods=['POST'])
 def verify_id_data():
     try:
@@ -366,15 +600,34 @@ def verify_id_data():
             return jsonify({'success': False, 'error': 'Missing form data or OCR data'}), 400
         
         # Compare the data
-        verification_result = compare_id_data(form_data, ocr_data)
+        with stage('verify_compare'):
+            verification_result = compare_id_data(form_data, ocr_data)
+        with stage('verify_record'):
+            request_id = record_verification(data, verification_result)
         
         return jsonify({
             'success': True,
-            'data': verification_result
+            'data': verification_result,
+            'request_id': request_id
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def record_verification(data, verification_result):
+    """Queue a VerificationRecord for the background writer and return its request id.
+    
+    'idCardHash' and 'selfieHash' from an earlier /match-faces call are stored with the
+    record, and the cached selfie encoding is added to the duplicate-face index.
+    """
+    selfie_hash = data.get('selfieHash')
+    face_encoding = None
+    if selfie_hash:
+        cached = get_face_encoding(selfie_hash)
+        face_encoding = cached[0] if cached else None
+    return verification_writer.record(data.get('formData', {}), verification_result,
+                                      id_card_hash=data.get('idCardHash'), selfie_hash=selfie_hash,
+                                      face_encoding=face_encoding)
+
 def compare_id_data(form_data, ocr_data):
     """Compare form data with OCR extracted data with 60% confidence threshold for successful verification"""
     results = {
@@ -0,0 +1,145 @@
+import os
+import time
+import queue
+import random
+import hashlib
+import threading
+
+from image_io import image_extension
+from background import BackgroundWorkers
+
+# Upload archiving: 'off', 'sample' (a fraction of uploads) or 'full'
+UPLOAD_ARCHIVE_MODE = os.getenv("UPLOAD_ARCHIVE_MODE", "off").lower()
+UPLOAD_ARCHIVE_SAMPLE_RATE = float(os.getenv("UPLOAD_ARCHIVE_SAMPLE_RATE", "0.05"))
+UPLOAD_ARCHIVE_DIR = os.getenv("UPLOAD_ARCHIVE_DIR", os.path.join("uploads", "archive"))
+UPLOAD_ARCHIVE_QUEUE = int(os.getenv("UPLOAD_ARCHIVE_QUEUE", "256"))
+
+# Retention: files older than the max age go first, then the oldest until under the size limit
+UPLOAD_ARCHIVE_MAX_BYTES = int(os.getenv("UPLOAD_ARCHIVE_MAX_BYTES", str(1024 * 1024 * 1024)))
+UPLOAD_ARCHIVE_MAX_AGE = float(os.getenv("UPLOAD_ARCHIVE_MAX_AGE", str(7 * 24 * 3600)))
+UPLOAD_ARCHIVE_SWEEP_INTERVAL = float(os.getenv("UPLOAD_ARCHIVE_SWEEP_INTERVAL", "3600"))
+
+ARCHIVE_MODES = ('off', 'sample', 'full')
+
+class UploadArchiver(BackgroundWorkers):
+    """Keeps copies of uploaded images off the request path.
+
+    Uploads are queued to a single background writer thread, stored as the original
+    bytes under their SHA-256 (so repeat uploads are written once), and pruned by
+    age and total size.
+    """
+
+    def __init__(self, mode=UPLOAD_ARCHIVE_MODE, sample_rate=UPLOAD_ARCHIVE_SAMPLE_RATE,
+                 directory=UPLOAD_ARCHIVE_DIR, max_bytes=UPLOAD_ARCHIVE_MAX_BYTES,
+                 max_age=UPLOAD_ARCHIVE_MAX_AGE, queue_size=UPLOAD_ARCHIVE_QUEUE,
+                 sweep_interval=UPLOAD_ARCHIVE_SWEEP_INTERVAL):
+        if mode not in ARCHIVE_MODES:
+            print(f"Warning: unknown UPLOAD_ARCHIVE_MODE '{mode}', upload archiving is disabled")
+            mode = 'off'
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.sweep_interval = sweep_interval
+
+        super().__init__(('queued', 'written', 'deduplicated', 'dropped', 'failed', 'swept'), 'upload-archiver')
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._last_sweep = 0.0
+
+    def should_archive(self):
+        if self.mode == 'full':
+            return True
+        return self.mode == 'sample' and random.random() < self.sample_rate
+
+    def archive(self, image_bytes, image_hash=None):
+        """Queue an upload for archiving; returns immediately and never raises"""
+        if not self.should_archive():
+            return False
+        self._start()
+        try:
+            self._queue.put_nowait((image_bytes, image_hash))
+        except queue.Full:
+            # Dropping a debug copy is better than slowing down the request
+            self._count('dropped')
+            return False
+        self._count('queued')
+        return True
+
+    def path_for(self, image_bytes, image_hash=None):
+        image_hash = image_hash or hashlib.sha256(image_bytes).hexdigest()
+        return os.path.join(self.directory, image_hash[:2], f"{image_hash}.{image_extension(image_bytes)}")
+
+    def _work(self):
+        while True:
+            image_bytes, image_hash = self._queue.get()
+            try:
+                self._write(image_bytes, image_hash)
+                if time.time() - self._last_sweep >= self.sweep_interval:
+                    self.sweep()
+            except Exception as e:
+                self._count('failed')
+                print(f"Upload archiving failed: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, image_bytes, image_hash=None):
+        path = self.path_for(image_bytes, image_hash)
+        if os.path.exists(path):
+            # Same content already archived; refresh its age for retention
+            os.utime(path)
+            self._count('deduplicated')
+            return path
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(image_bytes)
+        os.replace(temp_path, path)
+        self._count('written')
+        return path
+
+    def sweep(self):
+        """Delete archived files past the max age, then the oldest ones beyond the size limit"""
+        self._last_sweep = time.time()
+        cutoff = self._last_sweep - self.max_age
+        files = []
+        removed = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                if stat.st_mtime < cutoff:
+                    removed += self._remove(path)
+                else:
+                    files.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            removed += self._remove(path)
+            total -= size
+
+        self._count('swept', removed)
+        return removed
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            return 1
+        except OSError:
+            return 0
+
+    def stats(self):
+        snapshot = self._counters_snapshot()
+        snapshot.update({'mode': self.mode, 'pending': self._queue.qsize()})
+        if self.mode == 'sample':
+            snapshot['sample_rate'] = self.sample_rate
+        return snapshot
+
+# Shared archiver instance
+upload_archiver = UploadArchiver()
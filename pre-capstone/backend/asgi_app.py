@@ -0,0 +1,195 @@
+# Async serving path for the verification backend, run with:
+#   uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+# Uploads are parsed on the event loop and OCR/face work runs on bounded
+# executors, so slow mobile uploads do not each pin an OS thread. Routes
+# without an async version here are served by the mounted Flask app.
+import os
+import time
+import asyncio
+import contextvars
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Mount, Route, WebSocketRoute
+from starlette.websockets import WebSocketDisconnect
+
+import app as service
+from face_tracking import face_sessions, SessionLimit
+from metrics import stage, begin_request, end_request, current_trace, observe_request, REQUESTS_IN_FLIGHT
+
+# Executor size and how many requests may wait for a CPU slot
+ASGI_CPU_WORKERS = int(os.getenv("ASGI_CPU_WORKERS", os.cpu_count() or 2))
+ASGI_MAX_PENDING = int(os.getenv("ASGI_MAX_PENDING", "64"))
+
+cpu_executor = ThreadPoolExecutor(max_workers=ASGI_CPU_WORKERS, thread_name_prefix='asgi-cpu')
+
+# Admission control: requests beyond this many in flight get a 503 instead of queueing forever
+pending = asyncio.BoundedSemaphore(ASGI_MAX_PENDING)
+
+async def run_cpu(function, *args, **kwargs):
+    """Run CPU-bound work on the bounded executor without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    # Carry the request's metrics trace into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(cpu_executor, lambda: context.run(function, *args, **kwargs))
+
+class MetricsMiddleware:
+    """Request metrics and Server-Timing for the async routes; the Flask app records its own"""
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = paths
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        endpoint = scope['path']
+        headers = dict(scope['headers'])
+        started = time.perf_counter()
+        token = begin_request(headers.get(b'x-server-timing', b'').lower() in (b'1', b'true', b'yes'))
+        status = [500]
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+                trace = current_trace()
+                if trace is not None and trace.server_timing:
+                    header = trace.server_timing_header(time.perf_counter() - started)
+                    message['headers'] = list(message.get('headers', [])) + [(b'server-timing', header.encode())]
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(endpoint)
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(endpoint)
+            observe_request(endpoint, scope['method'], status[0], time.perf_counter() - started)
+            end_request(token)
+
+async def process_image(request):
+    form = await request.form()
+    try:
+        upload = form.get('image')
+        if upload is None or not hasattr(upload, 'read'):
+            return JSONResponse({'success': False, 'error': 'No image file provided'}, status_code=400)
+        if upload.filename == '':
+            return JSONResponse({'success': False, 'error': 'No selected file'}, status_code=400)
+
+        try:
+            options = service.parse_processing_options(form)
+        except ValueError as e:
+            return JSONResponse({'success': False, 'error': str(e)}, status_code=400)
+
+        image_bytes = await upload.read()
+    finally:
+        await form.close()
+
+    if pending.locked():
+        return JSONResponse({'success': False, 'error': 'Server is busy, please retry shortly'}, status_code=503)
+
+    async with pending:
+        try:
+            result = await run_cpu(service.run_processing, image_bytes, options)
+            if result.get('rejected'):
+                return JSONResponse(result, status_code=422)
+            if service.wants_multipart(options, result):
+                body, content_type = service.multipart_response_body(result)
+                return Response(body, media_type=content_type)
+            return JSONResponse(service.json_result(result))
+        except service.ImageDecodeError as e:
+            return JSONResponse({'success': False, 'error': str(e)}, status_code=400)
+        except service.OCRPoolBusy as e:
+            return JSONResponse({'success': False, 'error': str(e)}, status_code=503)
+        except Exception as e:
+            return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+async def verify_id_data(request):
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data:
+        return JSONResponse({'success': False, 'error': 'No data provided'}, status_code=400)
+
+    form_data = data.get('formData', {})
+    ocr_data = data.get('ocrData', {})
+    if not form_data or not ocr_data:
+        return JSONResponse({'success': False, 'error': 'Missing form data or OCR data'}, status_code=400)
+
+    try:
+        with stage('verify_compare'):
+            verification_result = await run_cpu(service.compare_id_data, form_data, ocr_data)
+        with stage('verify_record'):
+            request_id = service.record_verification(data, verification_result)
+        return JSONResponse({'success': True, 'data': verification_result, 'request_id': request_id})
+    except Exception as e:
+        return JSONResponse({'success': False, 'error': str(e)}, status_code=500)
+
+def session_open(session):
+    return face_sessions.get(session.session_id) is session
+
+async def face_stream(websocket):
+    """Camera frames as binary messages in, one JSON feedback message per frame out.
+
+    Detection options come from the query string; the socket closes once the face
+    has been stable for enough frames.
+    """
+    await websocket.accept()
+    if not service.FACE_RECOGNITION_AVAILABLE:
+        await websocket.send_json({'success': False, 'error': 'Face recognition module is not installed'})
+        await websocket.close()
+        return
+    try:
+        session = face_sessions.create(service.parse_detection_options(websocket.query_params))
+    except (ValueError, SessionLimit) as e:
+        await websocket.send_json({'success': False, 'error': str(e)})
+        await websocket.close()
+        return
+
+    await websocket.send_json({'success': True, 'data': {'session_id': session.session_id,
+                                                         'stable_frames': session.stable_frames}})
+    try:
+        while True:
+            frame_bytes = await websocket.receive_bytes()
+            try:
+                result = await run_cpu(service.process_stream_frame, session, frame_bytes)
+            except ValueError as e:
+                result = {'success': False, 'error': str(e)}
+            await websocket.send_json(result)
+            # A decode error only loses that frame; the frame limit or a stable face ends the stream
+            if result['success'] and result['data']['done'] or not result['success'] and not session_open(session):
+                break
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        face_sessions.close(session.session_id)
+
+@asynccontextmanager
+async def lifespan(app):
+    # The async routes never reach Flask's before_request, so start the purge at startup
+    service.start_background_jobs()
+    yield
+
+app = Starlette(
+    lifespan=lifespan,
+    routes=[
+        Route('/process-image', process_image, methods=['POST']),
+        Route('/verify-id-data', verify_id_data, methods=['POST']),
+        WebSocketRoute('/face-stream/ws', face_stream),
+        # Everything else is served by the synchronous Flask app
+        Mount('/', app=WSGIMiddleware(service.app))
+    ],
+    middleware=[
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'],
+                   expose_headers=['Server-Timing']),
+        Middleware(MetricsMiddleware, paths=('/process-image', '/verify-id-data'))
+    ]
+)
@@ -0,0 +1,53 @@
+import time
+import threading
+
+class BackgroundWorkers:
+    """Base for services that hand work to daemon threads through a queue.
+
+    Subclasses create self._queue and implement _work, which must call
+    self._queue.task_done() for every item it takes. The threads start on first
+    use, so importing a service never starts them.
+    """
+
+    def __init__(self, counters, thread_name, threads=1):
+        self._thread_name = thread_name
+        self._thread_count = max(1, threads)
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._counters_lock = threading.Lock()
+        self._counters = dict.fromkeys(counters, 0)
+
+    def _count(self, name, amount=1):
+        # Bumped from request threads and from every worker thread
+        with self._counters_lock:
+            self._counters[name] += amount
+
+    def _counters_snapshot(self):
+        with self._counters_lock:
+            return dict(self._counters)
+
+    def _on_start(self):
+        """Runs once, under the start lock, before the threads start"""
+        pass
+
+    def _start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            self._on_start()
+            for number in range(self._thread_count):
+                name = self._thread_name if self._thread_count == 1 else f'{self._thread_name}-{number}'
+                thread = threading.Thread(target=self._work, name=name, daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def flush(self, timeout=None):
+        """Wait until every queued item is done; returns False if the timeout ran out first"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
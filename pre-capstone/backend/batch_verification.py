@@ -0,0 +1,187 @@
+import os
+import io
+import sys
+import json
+import time
+import zipfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+# Batch configuration
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", os.cpu_count() or 2))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+
+class BatchError(Exception):
+    """Raised when a batch upload is malformed"""
+    pass
+
+def parse_multipart_batch(files, form):
+    """Collect items from fields named id_card_<n>, selfie_<n> and form_data_<n>"""
+    indexes = sorted({
+        name.rsplit('_', 1)[1]
+        for name in list(files.keys()) + list(form.keys())
+        if name.rsplit('_', 1)[0] in ('id_card', 'selfie', 'form_data') and '_' in name
+    }, key=lambda index: (len(index), index))
+
+    items = []
+    for index in indexes:
+        id_card = files.get(f'id_card_{index}')
+        selfie = files.get(f'selfie_{index}')
+        if id_card is None or selfie is None:
+            raise BatchError(f'Item {index} needs both id_card_{index} and selfie_{index}')
+        try:
+            form_data = json.loads(form.get(f'form_data_{index}', '{}'))
+        except ValueError:
+            raise BatchError(f'form_data_{index} is not valid JSON')
+        items.append({
+            'id': index,
+            'id_card': id_card.read(),
+            'selfie': selfie.read(),
+            'form_data': form_data
+        })
+    return items
+
+def parse_zip_batch(zip_bytes):
+    """Collect items from a zip with a manifest.json listing id_card/selfie paths and form_data"""
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(zip_bytes))
+        manifest = json.loads(archive.read('manifest.json'))
+    except (zipfile.BadZipFile, KeyError, ValueError):
+        raise BatchError('Batch zip must contain a valid manifest.json')
+
+    items = []
+    for position, entry in enumerate(manifest):
+        try:
+            items.append({
+                'id': str(entry.get('id', position)),
+                'id_card': archive.read(entry['id_card']),
+                'selfie': archive.read(entry['selfie']),
+                'form_data': entry.get('form_data', {})
+            })
+        except (KeyError, TypeError, AttributeError):
+            raise BatchError(f'Manifest entry {position} is missing or references unknown files')
+    return items
+
+def _init_worker(ocr_workers=1):
+    """Each worker process is one slot of batch parallelism, so keep its own pools single-threaded.
+
+    Under spawn the service modules may already be imported by the time this runs (the
+    child re-imports the parent's main module first), so the pools are rebuilt here
+    rather than sized through environment variables read at import time.
+    """
+    # Started with `python app.py`, the child re-imported app.py as __mp_main__; reuse it
+    # instead of loading the service a second time under its own name
+    main = sys.modules.get('__mp_main__')
+    if main is not None and os.path.basename(getattr(main, '__file__', '') or '') == 'app.py':
+        sys.modules.setdefault('app', main)
+
+    import ocr_engine
+    import id_layout
+    ocr_engine.configure_pool(ocr_workers)
+    id_layout.configure_field_workers(ocr_workers)
+    # Read by each tesseract subprocess when it starts
+    os.environ['OMP_THREAD_LIMIT'] = str(ocr_workers)
+
+def verify_item(item):
+    """Run OCR, face matching and data comparison for one (id_card, selfie, form_data) tuple"""
+    # Imported here so the service is loaded in the worker process, not when the parent imports this module
+    import app as service
+    from image_io import decode_image
+
+    started = time.perf_counter()
+    result = {'id': item['id'], 'success': False}
+    try:
+        # Each image is decoded once and shared by the OCR and face stages
+        images = {role: decode_image(item[role]) for role in ('id_card', 'selfie')}
+        ocr_result = service.process_ocr(
+            images['id_card'],
+            layout=service.OCR_LAYOUT,
+            preprocess_steps=service.parse_pipeline(service.OCR_PREPROCESS)
+        )
+        if not ocr_result['success']:
+            result['error'] = ocr_result['error']
+            return result
+        extracted = ocr_result['data']['extracted']
+        result['ocr'] = extracted
+        result['data_verification'] = service.compare_id_data(item['form_data'], extracted)
+
+        if service.FACE_RECOGNITION_AVAILABLE:
+            encodings = {}
+            for role in ('id_card', 'selfie'):
+                encoding, _ = service.get_face_encoding(
+                    service.hash_image(item[role]),
+                    lambda image=images[role]: image
+                )
+                encodings[role] = encoding
+            # Handed to the parent process for the duplicate-face index, not sent to clients
+            if encodings['selfie'] is not None:
+                result['selfie_encoding'] = encodings['selfie'].tolist()
+            if encodings['id_card'] is None or encodings['selfie'] is None:
+                result['face_match'] = {'match': False, 'error': 'No face found in the ID card or selfie'}
+            else:
+                result['face_match'] = service.compare_faces(encodings['id_card'], encodings['selfie'])
+
+        result['success'] = True
+        return result
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+    finally:
+        result['processing_time_seconds'] = round(time.perf_counter() - started, 3)
+
+_executor = None
+
+def get_executor():
+    """Process pool shared by all batch requests, started on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=BATCH_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker
+        )
+    return _executor
+
+def reset_executor(executor):
+    """Drop a broken pool so get_executor starts a new one"""
+    global _executor
+    if _executor is executor:
+        _executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def run_batch(items, on_result=None):
+    """Yield one NDJSON line per item as it finishes, then a summary line.
+
+    on_result(item, result, selfie_encoding) runs in this process before each line is sent.
+    """
+    started = time.perf_counter()
+    executor = get_executor()
+    futures = {executor.submit(verify_item, item): item for item in items}
+
+    succeeded = 0
+    for future in as_completed(futures):
+        try:
+            result = future.result()
+        except BrokenProcessPool as e:
+            # A crashed worker poisons the pool; start a fresh one for the next batch
+            reset_executor(executor)
+            result = {'id': futures[future]['id'], 'success': False, 'error': str(e)}
+        except Exception as e:
+            result = {'id': futures[future]['id'], 'success': False, 'error': str(e)}
+        selfie_encoding = result.pop('selfie_encoding', None)
+        if on_result is not None:
+            try:
+                on_result(futures[future], result, selfie_encoding)
+            except Exception as e:
+                print(f"Batch result callback failed: {e}")
+        succeeded += 1 if result['success'] else 0
+        yield json.dumps(result) + '\n'
+
+    yield json.dumps({
+        'done': True,
+        'total': len(items),
+        'succeeded': succeeded,
+        'failed': len(items) - succeeded,
+        'elapsed_seconds': round(time.perf_counter() - started, 3)
+    }) + '\n'
@@ -0,0 +1,230 @@
+# Offline per-stage benchmark over the sample images:
+#   python benchmark.py                           # p50/p95 and throughput per stage, process peak RSS
+#   python benchmark.py --save baseline.json      # record a baseline
+#   python benchmark.py --compare baseline.json   # exit 1 if a stage got slower
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import platform
+from datetime import datetime
+
+# Keep the service's background threads out of the measurements
+os.environ.setdefault('PURGE_IN_PROCESS', 'false')
+os.environ.setdefault('PERSIST_VERIFICATIONS', 'false')
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import app as service
+from image_io import decode_image
+from preprocessing import OCR_PREPROCESS, parse_pipeline, apply_pipeline
+from ocr_engine import run_ocr
+from face_detection import detect_faces, FACE_RECOGNITION_AVAILABLE
+from similarity import similarity_score
+from quality import assess_quality
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Used for the extraction and comparison stages when Tesseract is not installed
+SAMPLE_OCR_TEXT = """REPUBLIC OF GHANA
+ECOWAS IDENTITY CARD
+Surname/Nom
+KING
+Firstnames/Prénoms
+DARRYL LAUD ABOAGYE
+Nationality/Nationalité
+GHANAIAN
+Sex/Sexe
+M
+Personal ID Number
+GHA-719819958-0
+"""
+
+SAMPLE_FORM_DATA = {
+    'firstName': 'Darryl',
+    'lastName': 'King',
+    'idNumber': 'GHA-719819958-0',
+    'nationality': 'Ghanaian',
+    'sex': 'Male'
+}
+
+STAGES = ('decode', 'quality', 'preprocess', 'ocr', 'extract', 'face_detection', 'compare')
+
+def default_images():
+    patterns = ('*.jpg', '*.jpeg', '*.png')
+    paths = []
+    for pattern in patterns:
+        paths.extend(glob.glob(os.path.join(BACKEND_DIR, 'uploads', pattern)))
+    student_id = os.path.join(BACKEND_DIR, 'Student ID.jpg')
+    if os.path.exists(student_id):
+        paths.append(student_id)
+    return sorted(paths)
+
+def tesseract_available():
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def summarize(durations):
+    samples = np.array(durations) * 1000.0
+    return {
+        'calls': len(durations),
+        'p50_ms': round(float(np.percentile(samples, 50)), 3),
+        'p95_ms': round(float(np.percentile(samples, 95)), 3),
+        'mean_ms': round(float(samples.mean()), 3),
+        'throughput_per_s': round(len(durations) / max(sum(durations), 1e-9), 2)
+    }
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+def run_benchmark(paths, repeat=5, warmup=1, stages=STAGES):
+    """Time each stage over every image; returns {stage: summary} plus skipped stages"""
+    corpus = []
+    for path in paths:
+        with open(path, 'rb') as f:
+            corpus.append((os.path.basename(path), f.read()))
+    if not corpus:
+        raise SystemExit('No images found to benchmark')
+
+    steps = parse_pipeline(OCR_PREPROCESS)
+    skipped = {}
+    if 'ocr' in stages and not tesseract_available():
+        skipped['ocr'] = 'tesseract is not installed'
+    if 'face_detection' in stages and not FACE_RECOGNITION_AVAILABLE:
+        skipped['face_detection'] = 'face_recognition is not installed'
+
+    durations = {stage: [] for stage in stages if stage not in skipped}
+    rss = {}
+    for iteration in range(warmup + repeat):
+        record = iteration >= warmup
+        for _, image_bytes in corpus:
+            timings = {}
+            image, timings['decode'] = timed(decode_image, image_bytes)
+            if 'quality' in durations:
+                _, timings['quality'] = timed(assess_quality, image)
+            if 'preprocess' in durations:
+                prepared, timings['preprocess'] = timed(apply_pipeline, image, steps)
+            else:
+                prepared = image
+            text = SAMPLE_OCR_TEXT
+            if 'ocr' in durations:
+                ocr_result, timings['ocr'] = timed(run_ocr, prepared, psm=3)
+                text = ocr_result['text'] or SAMPLE_OCR_TEXT
+            extracted, elapsed = timed(service.extract_id_card_data, text)
+            timings['extract'] = elapsed
+            if 'face_detection' in durations:
+                _, timings['face_detection'] = timed(detect_faces, image)
+            if 'compare' in durations:
+                started = time.perf_counter()
+                service.compare_id_data(SAMPLE_FORM_DATA, extracted)
+                similarity_score(SAMPLE_FORM_DATA['firstName'].lower(), (extracted.get('firstName') or '').lower())
+                timings['compare'] = time.perf_counter() - started
+
+            if record:
+                for stage, elapsed in timings.items():
+                    if stage in durations:
+                        durations[stage].append(elapsed)
+                        rss[stage] = peak_rss_mb()
+
+    results = {}
+    for stage, samples in durations.items():
+        results[stage] = summarize(samples)
+        # ru_maxrss is the whole process's high-water mark so far, not this stage's own usage
+        results[stage]['process_peak_rss_mb'] = rss.get(stage)
+    return results, skipped
+
+def compare_to_baseline(results, baseline, tolerance, min_delta_ms):
+    """List stages whose p95 grew by more than tolerance (and min_delta_ms) over the baseline"""
+    regressions = []
+    for stage, current in results.items():
+        previous = baseline.get('stages', {}).get(stage)
+        if not previous:
+            continue
+        limit = previous['p95_ms'] * (1.0 + tolerance)
+        if current['p95_ms'] > limit and current['p95_ms'] - previous['p95_ms'] > min_delta_ms:
+            regressions.append((stage, previous['p95_ms'], current['p95_ms']))
+    return regressions
+
+def print_table(results, skipped):
+    print(f"{'stage':<16}{'calls':>7}{'p50 ms':>11}{'p95 ms':>11}{'ops/s':>11}{'proc peak RSS MB':>19}")
+    for stage in STAGES:
+        if stage in results:
+            row = results[stage]
+            print(f"{stage:<16}{row['calls']:>7}{row['p50_ms']:>11.3f}{row['p95_ms']:>11.3f}"
+                  f"{row['throughput_per_s']:>11.2f}{str(row['process_peak_rss_mb']):>19}")
+        elif stage in skipped:
+            print(f"{stage:<16}  skipped: {skipped[stage]}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the verification pipeline stage by stage')
+    parser.add_argument('images', nargs='*', help='image files (default: uploads/ and Student ID.jpg)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed passes over the images')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed passes first')
+    parser.add_argument('--stages', default=','.join(STAGES), help='comma separated stages to run')
+    parser.add_argument('--save', help='write the results to this JSON baseline')
+    parser.add_argument('--compare', help='fail when slower than this JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 growth, 0.2 = 20%%')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='ignore p95 changes smaller than this')
+    args = parser.parse_args(argv)
+
+    stages = tuple(stage.strip() for stage in args.stages.split(',') if stage.strip())
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    # Every pass needs the decoded image and extracted fields
+    stages = tuple(stage for stage in STAGES if stage in stages or stage in ('decode', 'extract'))
+
+    paths = args.images or default_images()
+    results, skipped = run_benchmark(paths, repeat=args.repeat, warmup=args.warmup, stages=stages)
+    print_table(results, skipped)
+
+    report = {
+        'meta': {
+            'created': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'images': [os.path.basename(path) for path in paths],
+            'repeat': args.repeat,
+            'preprocess': OCR_PREPROCESS
+        },
+        'stages': results,
+        'skipped': skipped
+    }
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.save}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, args.tolerance, args.min_delta_ms)
+        for stage, before, after in regressions:
+            print(f"REGRESSION {stage}: p95 {before:.3f} ms -> {after:.3f} ms")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.compare}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
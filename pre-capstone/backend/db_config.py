@@ -1,12 +1,18 @@
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, Column, Integer, String, LargeBinary, DateTime, Text
+from sqlalchemy import create_engine, inspect, text, func, Column, Integer, String, LargeBinary, DateTime, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 import base64
 import hashlib
+import hmac
+import re
+import json
+import threading
+import time
+import numpy as np
 
 # Load environment variables
 load_dotenv()
@@ -18,10 +24,32 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME", "verification_db")
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# DATABASE_URL overrides the settings above, e.g. sqlite:///verification.db for local runs and tests
+DATABASE_URL = os.getenv("DATABASE_URL") or f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Connection pool settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def engine_options(url):
+    """Pool options for create_engine; SQLite gets its own defaults"""
+    # Check connections before use so restarts and idle timeouts do not surface as request errors
+    options = {'pool_pre_ping': True}
+    if url.startswith('sqlite'):
+        options['connect_args'] = {'check_same_thread': False}
+        return options
+    options.update({
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE
+    })
+    return options
 
 # Create SQLAlchemy engine
-engine = create_engine(DATABASE_URL)
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -37,9 +65,21 @@ def get_encryption_key():
     else:
         return stored_key.encode()
 
+def get_encryption_keys():
+    """Keys for MultiFernet: ENCRYPTION_KEYS (comma separated, newest first) or ENCRYPTION_KEY.
+
+    New data is always encrypted with the first key; older keys are only used to decrypt,
+    so a key is rotated by putting the new one in front.
+    """
+    stored_keys = [key.strip() for key in os.getenv("ENCRYPTION_KEYS", "").split(',') if key.strip()]
+    if stored_keys:
+        return [key.encode() for key in stored_keys]
+    return [get_encryption_key()]
+
 # Initialize encryption
-encryption_key = get_encryption_key()
-cipher_suite = Fernet(encryption_key)
+encryption_keys = get_encryption_keys()
+encryption_key = encryption_keys[0]
+cipher_suite = MultiFernet([Fernet(key) for key in encryption_keys])
 
 # Encryption/decryption functions
 def encrypt_data(data):
@@ -50,6 +90,39 @@ def encrypt_data(data):
 def decrypt_data(encrypted_data):
     return cipher_suite.decrypt(encrypted_data)
 
+# Blind index for id_number: a keyed HMAC of the normalized value, so records can be
+# looked up by ID number without decrypting them. The key is independent of the
+# encryption keys, so rotating those leaves every index value unchanged.
+def get_blind_index_key():
+    stored_key = os.getenv("BLIND_INDEX_KEY")
+    if stored_key:
+        return stored_key.encode()
+    if os.getenv("ENCRYPTION_KEYS") or os.getenv("ENCRYPTION_KEY"):
+        # Deriving it from a configured encryption key would silently break lookups on rotation
+        raise RuntimeError('BLIND_INDEX_KEY must be set when ENCRYPTION_KEY or ENCRYPTION_KEYS is set')
+    # Development only, like the generated encryption key above
+    key = base64.urlsafe_b64encode(os.urandom(32))
+    print(f"Generated new blind index key: {key.decode()}")
+    return key
+
+blind_index_key = get_blind_index_key()
+
+def normalize_id_number(id_number):
+    """Normalize the way compare_id_data does: no spaces or dashes, upper case, GH prefix as GHA"""
+    value = re.sub(r'[\s\-]', '', str(id_number)).upper()
+    if value.startswith('GH') and not value.startswith('GHA'):
+        value = 'GHA' + value[2:]
+    return value
+
+def blind_index(id_number):
+    """Deterministic HMAC-SHA256 of a normalized ID number, or None for an empty value"""
+    if not id_number:
+        return None
+    value = normalize_id_number(id_number)
+    if not value:
+        return None
+    return hmac.new(blind_index_key, value.encode(), hashlib.sha256).hexdigest()
+
 # Database models
 class VerificationRecord(Base):
     __tablename__ = "verification_records"
@@ -60,15 +133,224 @@ class VerificationRecord(Base):
     last_name = Column(LargeBinary)   # Encrypted
     id_number = Column(LargeBinary)   # Encrypted
     nationality = Column(LargeBinary) # Encrypted
+    pii = Column(LargeBinary)         # Encrypted envelope of the four fields above; new rows only fill this
+    id_number_index = Column(String(64), index=True)  # Blind index of id_number for lookups
     selfie_hash = Column(String(64))  # Hash of selfie image
     id_card_hash = Column(String(64)) # Hash of ID card image
     verification_result = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
-    expiry_time = Column(DateTime, default=lambda: datetime.utcnow() + timedelta(minutes=5))
+    expiry_time = Column(DateTime, default=lambda: datetime.utcnow() + timedelta(minutes=5), index=True)  # Purge sweeps by this
+
+# Face embedding index for duplicate-identity detection. The memory-mapped files hold
+# biometric data unencrypted (a memmap cannot be encrypted in place), so they are
+# created owner-only; keep FACE_INDEX_DIR on an encrypted volume.
+FACE_INDEX_DIR = os.getenv("FACE_INDEX_DIR", "")
+FACE_ENCODING_SIZE = 128
+
+class FaceEmbeddingIndex:
+    """Contiguous float32 matrix of face encodings keyed by VerificationRecord id.
+
+    With a directory the arrays are memory-mapped files (mode 0600, in a 0700 directory),
+    otherwise they live in RAM.
+    Rows are appended at the end; deletes only clear the live flag, and the matrix is
+    compacted once enough dead rows pile up.
+    """
+
+    def __init__(self, directory=FACE_INDEX_DIR, initial_capacity=1024):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._count = 0
+        self._live_count = 0
+
+        capacity = initial_capacity
+        if directory:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            os.chmod(directory, 0o700)
+            meta_path = os.path.join(directory, 'index.json')
+            if os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                capacity = meta['capacity']
+                self._count = meta['count']
+        self._allocate(capacity, reuse=self._count > 0)
+        self._live_count = int(self._live[:self._count].sum())
+
+    def _array(self, name, dtype, shape, data=None, reuse=False):
+        if not self.directory:
+            array = np.zeros(shape, dtype=dtype)
+            if data is not None:
+                array[:len(data)] = data
+            return array
+
+        path = os.path.join(self.directory, name + '.npy')
+        if reuse and os.path.exists(path):
+            existing = np.load(path, mmap_mode='r+')
+            if existing.shape == shape and existing.dtype == dtype:
+                # Files from before the permissions were restricted
+                os.chmod(path, 0o600)
+                return existing
+            data = np.array(existing[:self._count])
+            del existing
+
+        # Create the file owner-only before numpy opens it, so the embeddings are never world-readable
+        os.close(os.open(path, os.O_CREAT | os.O_WRONLY, 0o600))
+        os.chmod(path, 0o600)
+        array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=shape)
+        if data is not None:
+            array[:len(data)] = data
+        return array
+
+    def _allocate(self, capacity, reuse=False):
+        names = [('embeddings', np.float32, (capacity, FACE_ENCODING_SIZE)),
+                 ('norms', np.float32, (capacity,)),
+                 ('record_ids', np.int64, (capacity,)),
+                 ('expiry', np.float64, (capacity,)),
+                 ('live', np.bool_, (capacity,))]
+
+        # Copy live rows out and drop the old maps before the files are recreated
+        old_data = {}
+        for name, _, _ in names:
+            old = getattr(self, '_' + name, None)
+            if old is not None:
+                old_data[name] = np.array(old[:self._count])
+                setattr(self, '_' + name, None)
+                del old
 
-# Create tables
-def init_db():
-    Base.metadata.create_all(bind=engine)
+        for name, dtype, shape in names:
+            setattr(self, '_' + name, self._array(name, dtype, shape, old_data.get(name), reuse))
+        self._capacity = capacity
+        self._save_meta()
+
+    def _save_meta(self):
+        if not self.directory:
+            return
+        for array in (self._embeddings, self._norms, self._record_ids, self._expiry, self._live):
+            array.flush()
+        meta_path = os.path.join(self.directory, 'index.json')
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump({'capacity': self._capacity, 'count': self._count}, f)
+        os.replace(meta_path + '.tmp', meta_path)
+
+    def _compact(self):
+        keep = np.flatnonzero(self._live[:self._count])
+        for array in (self._embeddings, self._norms, self._record_ids, self._expiry, self._live):
+            array[:len(keep)] = array[keep]
+        self._live[len(keep):self._count] = False
+        self._count = len(keep)
+
+    def add(self, record_ids, encodings, expiry_times):
+        """Append encodings (n x 128) for the given record ids; expiry times are unix seconds"""
+        record_ids = np.atleast_1d(np.asarray(record_ids, dtype=np.int64))
+        encodings = np.atleast_2d(np.asarray(encodings, dtype=np.float32))
+        expiry_times = np.broadcast_to(np.asarray(expiry_times, dtype=np.float64), record_ids.shape)
+        n = len(record_ids)
+
+        with self._lock:
+            if self._count + n > self._capacity:
+                if self._live_count + n <= self._capacity // 2:
+                    self._compact()
+                else:
+                    capacity = self._capacity
+                    while self._live_count + n > capacity // 2:
+                        capacity *= 2
+                    self._compact()
+                    self._allocate(capacity)
+
+            start, end = self._count, self._count + n
+            self._embeddings[start:end] = encodings
+            self._norms[start:end] = np.einsum('ij,ij->i', encodings, encodings)
+            self._record_ids[start:end] = record_ids
+            self._expiry[start:end] = expiry_times
+            self._live[start:end] = True
+            self._count = end
+            self._live_count += n
+            self._save_meta()
+
+    def remove(self, record_ids):
+        """Delete the entries for the given record ids; returns how many were removed"""
+        with self._lock:
+            mask = self._live[:self._count] & np.isin(self._record_ids[:self._count], record_ids)
+            return self._drop(mask)
+
+    def expire(self, now=None):
+        """Delete entries whose expiry time has passed; returns how many were removed"""
+        now = time.time() if now is None else now
+        with self._lock:
+            mask = self._live[:self._count] & (self._expiry[:self._count] < now)
+            return self._drop(mask)
+
+    def _drop(self, mask):
+        removed = int(mask.sum())
+        if removed:
+            self._live[:self._count][mask] = False
+            self._live_count -= removed
+            if self._live_count < self._count // 2:
+                self._compact()
+            self._save_meta()
+        return removed
+
+    def search(self, encodings, k=5, max_distance=None):
+        """Top-k nearest neighbours for one or more query encodings.
+
+        Returns, per query, a list of (record_id, distance) sorted by distance.
+        """
+        queries = np.atleast_2d(np.asarray(encodings, dtype=np.float32))
+        with self._lock:
+            n = self._count
+            if self._live_count == 0:
+                return [[] for _ in range(len(queries))]
+            # |a - q|^2 = |a|^2 + |q|^2 - 2 a.q, for every row and query in one product
+            distances = self._norms[:n, None] - 2.0 * (self._embeddings[:n] @ queries.T)
+            distances += np.einsum('ij,ij->i', queries, queries)[None, :]
+            distances[~self._live[:n]] = np.inf
+            record_ids = np.array(self._record_ids[:n])
+            k = min(k, self._live_count)
+
+        np.maximum(distances, 0, out=distances)
+        np.sqrt(distances, out=distances)
+
+        nearest = np.argpartition(distances, k - 1, axis=0)[:k]
+        results = []
+        for column in range(distances.shape[1]):
+            rows = nearest[:, column]
+            rows = rows[np.argsort(distances[rows, column])]
+            matches = [(int(record_ids[row]), float(distances[row, column])) for row in rows]
+            if max_distance is not None:
+                matches = [match for match in matches if match[1] <= max_distance]
+            results.append(matches)
+        return results
+
+    def __len__(self):
+        return self._live_count
+
+_face_index = None
+_face_index_lock = threading.Lock()
+
+def get_face_index():
+    """The shared face index, opened on first use.
+
+    Only the serving process uses it (the writer, /match-faces and the expiry job);
+    batch workers, benchmark.py and purge.py import this module too and must not open
+    the index files, let alone rewrite index.json.
+    """
+    global _face_index
+    with _face_index_lock:
+        if _face_index is None:
+            _face_index = FaceEmbeddingIndex()
+        return _face_index
+
+# Create tables, and add columns and indexes introduced since they were created
+def init_db(bind=engine):
+    Base.metadata.create_all(bind=bind)
+    table = VerificationRecord.__table__
+    existing = {column['name'] for column in inspect(bind).get_columns(table.name)}
+    with bind.begin() as connection:
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=bind.dialect)
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+    for index in table.indexes:
+        index.create(bind=bind, checkfirst=True)
 
 # Get database session
 def get_db():
@@ -78,6 +360,27 @@ def get_db():
     finally:
         db.close()
 
+# Lookups by ID number through the blind index (a B-tree lookup, nothing is decrypted)
+def find_records_by_id_number(db, id_number, include_expired=False):
+    """VerificationRecords whose ID number normalizes to the same value, newest first"""
+    index_value = blind_index(id_number)
+    if index_value is None:
+        return []
+    query = db.query(VerificationRecord).filter(VerificationRecord.id_number_index == index_value)
+    if not include_expired:
+        query = query.filter(VerificationRecord.expiry_time > datetime.utcnow())
+    return query.order_by(VerificationRecord.created_at.desc()).all()
+
+def count_records_by_id_number(db, id_number, include_expired=False):
+    """How many records use this ID number, e.g. to flag reuse across verifications"""
+    index_value = blind_index(id_number)
+    if index_value is None:
+        return 0
+    query = db.query(func.count(VerificationRecord.id)).filter(VerificationRecord.id_number_index == index_value)
+    if not include_expired:
+        query = query.filter(VerificationRecord.expiry_time > datetime.utcnow())
+    return query.scalar()
+
 # Hash function for images
 def hash_image(image_data):
     return hashlib.sha256(image_data).hexdigest()
\ No newline at end of file
@@ -0,0 +1,146 @@
+import os
+
+import cv2
+
+# Try to import face_recognition, but make it optional
+try:
+    import face_recognition
+    FACE_RECOGNITION_AVAILABLE = True
+except ImportError:
+    print("Warning: face_recognition module not available. Facial recognition features will be disabled.")
+    FACE_RECOGNITION_AVAILABLE = False
+
+# Detection defaults, overridable per request
+FACE_DETECTION_MAX_DIMENSION = int(os.getenv("FACE_DETECTION_MAX_DIMENSION", "640"))
+FACE_DETECTION_MODEL = os.getenv("FACE_DETECTION_MODEL", "hog")
+FACE_DETECTION_UPSAMPLE = int(os.getenv("FACE_DETECTION_UPSAMPLE", "1"))
+FACE_MODELS = ('hog', 'cnn')
+
+# Response defaults for /process-image facial requests, overridable per request:
+# 'image' (annotated JPEG as base64 in the JSON), 'boxes' (no image) or
+# 'multipart' (JSON part plus a raw JPEG part)
+FACE_RESPONSE_FORMAT = os.getenv("FACE_RESPONSE_FORMAT", "image")
+FACE_THUMBNAIL_MAX_DIMENSION = int(os.getenv("FACE_THUMBNAIL_MAX_DIMENSION", "0"))
+FACE_JPEG_QUALITY = int(os.getenv("FACE_JPEG_QUALITY", "90"))
+RESPONSE_FORMATS = ('image', 'boxes', 'multipart')
+
+def parse_detection_options(form):
+    """Read detection options from a request form, raising ValueError on bad input"""
+    model = form.get('face_model', FACE_DETECTION_MODEL)
+    if model not in FACE_MODELS:
+        raise ValueError(f'Unsupported face model: {model}')
+
+    try:
+        upsample = int(form.get('upsample', FACE_DETECTION_UPSAMPLE))
+        max_dimension = int(form.get('max_dimension', FACE_DETECTION_MAX_DIMENSION))
+    except (TypeError, ValueError):
+        raise ValueError('upsample and max_dimension must be integers')
+    if not 0 <= upsample <= 3:
+        raise ValueError('upsample must be between 0 and 3')
+    if max_dimension < 0:
+        raise ValueError('max_dimension must not be negative')
+
+    return {'model': model, 'upsample': upsample, 'max_dimension': max_dimension}
+
+def options_signature(options):
+    """Canonical string for detection options, used in cache keys"""
+    return f"{options['model']}|{options['upsample']}|{options['max_dimension']}"
+
+def parse_response_options(form):
+    """Read response format options from a request form, raising ValueError on bad input"""
+    response_format = form.get('response_format', FACE_RESPONSE_FORMAT)
+    if response_format not in RESPONSE_FORMATS:
+        raise ValueError(f'Unsupported response format: {response_format}')
+
+    try:
+        thumbnail_size = int(form.get('thumbnail_size', FACE_THUMBNAIL_MAX_DIMENSION))
+        quality = int(form.get('jpeg_quality', FACE_JPEG_QUALITY))
+    except (TypeError, ValueError):
+        raise ValueError('thumbnail_size and jpeg_quality must be integers')
+    if thumbnail_size < 0:
+        raise ValueError('thumbnail_size must not be negative')
+    if not 1 <= quality <= 100:
+        raise ValueError('jpeg_quality must be between 1 and 100')
+
+    return {'format': response_format, 'thumbnail_size': thumbnail_size, 'quality': quality}
+
+def response_signature(options):
+    """Canonical string for response options, used in cache keys.
+
+    'image' and 'multipart' carry the same annotated JPEG, so they share entries.
+    """
+    if options['format'] == 'boxes':
+        return 'boxes'
+    return f"image|{options['thumbnail_size']}|{options['quality']}"
+
+def rescale_box(box, scale, width, height):
+    """Map a (top, right, bottom, left) box from a downscaled image back to full resolution"""
+    top, right, bottom, left = box
+    return (
+        max(0, int(round(top * scale))),
+        min(width, int(round(right * scale))),
+        min(height, int(round(bottom * scale))),
+        max(0, int(round(left * scale)))
+    )
+
+def detect_faces(image, model=FACE_DETECTION_MODEL, upsample=FACE_DETECTION_UPSAMPLE,
+                 max_dimension=FACE_DETECTION_MAX_DIMENSION):
+    """Find faces on a downscaled copy and return boxes in full-resolution coordinates.
+
+    When the downscaled pass finds nothing, the search is retried once: with an extra
+    upsample on the small copy if it is at most half size (still cheaper than full
+    resolution), otherwise on the full-resolution image.
+
+    Returns (face_locations, info) where info describes how detection ran.
+    """
+    height, width = image.shape[:2]
+    scale = 1.0
+    if max_dimension and max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+
+    if scale == 1.0:
+        locations = face_recognition.face_locations(image, number_of_times_to_upsample=upsample, model=model)
+        return locations, {'scale': 1.0, 'upsample': upsample, 'fallback': None}
+
+    small = cv2.resize(image, (int(round(width * scale)), int(round(height * scale))),
+                       interpolation=cv2.INTER_AREA)
+    locations = face_recognition.face_locations(small, number_of_times_to_upsample=upsample, model=model)
+    fallback = None
+
+    if not locations and scale <= 0.5:
+        fallback = 'upsample'
+        locations = face_recognition.face_locations(small, number_of_times_to_upsample=upsample + 1, model=model)
+    elif not locations:
+        fallback = 'full_resolution'
+        locations = face_recognition.face_locations(image, number_of_times_to_upsample=upsample, model=model)
+        return locations, {'scale': 1.0, 'upsample': upsample, 'fallback': fallback}
+
+    inverse = 1.0 / scale
+    locations = [rescale_box(box, inverse, width, height) for box in locations]
+    return locations, {
+        'scale': round(scale, 4),
+        'upsample': upsample + 1 if fallback else upsample,
+        'fallback': fallback
+    }
+
+def annotate_faces(image, face_locations, max_dimension=FACE_THUMBNAIL_MAX_DIMENSION, quality=FACE_JPEG_QUALITY):
+    """Draw face boxes on an RGB image and return it as JPEG bytes.
+
+    The image is shrunk to max_dimension (0 keeps full size) before the single
+    RGB to BGR conversion, so thumbnails cost less to convert, draw and encode.
+    """
+    height, width = image.shape[:2]
+    scale = 1.0
+    if max_dimension and max(height, width) > max_dimension:
+        scale = max_dimension / max(height, width)
+        image = cv2.resize(image, (int(round(width * scale)), int(round(height * scale))),
+                           interpolation=cv2.INTER_AREA)
+
+    annotated = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    small_height, small_width = annotated.shape[:2]
+    for box in face_locations:
+        top, right, bottom, left = rescale_box(box, scale, small_width, small_height)
+        cv2.rectangle(annotated, (left, top), (right, bottom), (0, 255, 0), 2)
+
+    _, buffer = cv2.imencode('.jpg', annotated, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buffer.tobytes()
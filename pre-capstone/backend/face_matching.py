@@ -0,0 +1,88 @@
+import os
+
+import numpy as np
+
+from face_detection import (
+    FACE_RECOGNITION_AVAILABLE, FACE_DETECTION_MODEL, FACE_DETECTION_UPSAMPLE,
+    FACE_DETECTION_MAX_DIMENSION, detect_faces, options_signature
+)
+from result_cache import ResultCache, make_key
+
+if FACE_RECOGNITION_AVAILABLE:
+    import face_recognition
+
+# Distances at or below this count as the same person (face_recognition's default)
+FACE_MATCH_TOLERANCE = float(os.getenv("FACE_MATCH_TOLERANCE", "0.6"))
+
+# Steepness of the logistic curve mapping distance to confidence
+FACE_MATCH_SLOPE = float(os.getenv("FACE_MATCH_SLOPE", "12"))
+
+# Encodings are small, so they get their own cache with a longer lifetime
+encoding_cache = ResultCache(
+    max_bytes=int(os.getenv("FACE_ENCODING_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+    ttl=float(os.getenv("FACE_ENCODING_CACHE_TTL", "3600")),
+    cache_dir=''
+)
+
+def largest_face(face_locations):
+    """Pick the biggest (top, right, bottom, left) box, e.g. the card portrait"""
+    return max(face_locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+
+def encoding_key(image_hash, detection_options):
+    options = {
+        'model': FACE_DETECTION_MODEL,
+        'upsample': FACE_DETECTION_UPSAMPLE,
+        'max_dimension': FACE_DETECTION_MAX_DIMENSION
+    }
+    options.update(detection_options)
+    return make_key(image_hash, 'encoding', variant=options_signature(options))
+
+def get_face_encoding(image_hash, load_image=None, detection_options=None):
+    """Return the 128-d encoding of the largest face for an image hash.
+
+    Encodings are cached per image hash; load_image is only called on a miss and must
+    return an RGB array. Returns (encoding or None, faces_found), or None when the hash
+    is unknown and there is no image to load.
+    """
+    detection_options = detection_options or {}
+    key = encoding_key(image_hash, detection_options)
+    cached = encoding_cache.get(key)
+    if cached is not None:
+        encoding = cached['encoding']
+        return (np.array(encoding, dtype=np.float64) if encoding else None), cached['faces_found']
+
+    if load_image is None:
+        return None
+
+    image = load_image()
+    face_locations, _ = detect_faces(image, **detection_options)
+    encoding = None
+    if face_locations:
+        encodings = face_recognition.face_encodings(image, known_face_locations=[largest_face(face_locations)])
+        if encodings:
+            encoding = encodings[0]
+
+    encoding_cache.set(key, {
+        'encoding': encoding.tolist() if encoding is not None else None,
+        'faces_found': len(face_locations)
+    })
+    return encoding, len(face_locations)
+
+def face_distance(known_encodings, encoding):
+    """Euclidean distance from one encoding to each row of known_encodings"""
+    known_encodings = np.atleast_2d(np.asarray(known_encodings, dtype=np.float64))
+    return np.linalg.norm(known_encodings - encoding, axis=1)
+
+def match_confidence(distance, tolerance=FACE_MATCH_TOLERANCE, slope=FACE_MATCH_SLOPE):
+    """Map a face distance to a 0-1 confidence; exactly 0.5 at the tolerance"""
+    return float(1.0 / (1.0 + np.exp(slope * (distance - tolerance))))
+
+def compare_faces(id_encoding, selfie_encoding, tolerance=FACE_MATCH_TOLERANCE):
+    """Compare the ID portrait with the selfie"""
+    distance = float(face_distance(id_encoding, selfie_encoding)[0])
+    return {
+        'distance': round(distance, 4),
+        'confidence': round(match_confidence(distance, tolerance), 4),
+        'match': distance <= tolerance,
+        'tolerance': tolerance
+    }
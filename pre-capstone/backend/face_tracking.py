@@ -0,0 +1,210 @@
+import os
+import time
+import uuid
+import threading
+
+import cv2
+
+from face_detection import detect_faces
+from face_matching import largest_face
+
+# Camera stream: stop once a well-framed face has held still for this many frames
+FACE_STREAM_STABLE_FRAMES = int(os.getenv("FACE_STREAM_STABLE_FRAMES", "5"))
+# Re-detect when template matching scores below this (normalized cross-correlation, -1..1)
+FACE_TRACK_MIN_CONFIDENCE = float(os.getenv("FACE_TRACK_MIN_CONFIDENCE", "0.6"))
+# Re-detect at least this often even while tracking looks good, to stop drift
+FACE_REDETECT_INTERVAL = int(os.getenv("FACE_REDETECT_INTERVAL", "15"))
+FACE_STREAM_MAX_FRAMES = int(os.getenv("FACE_STREAM_MAX_FRAMES", "300"))
+FACE_STREAM_SESSION_TTL = float(os.getenv("FACE_STREAM_SESSION_TTL", "120"))
+FACE_STREAM_MAX_SESSIONS = int(os.getenv("FACE_STREAM_MAX_SESSIONS", "100"))
+
+# Framing rules, as fractions of the frame width
+MIN_FACE_WIDTH = 0.2
+MAX_FACE_WIDTH = 0.8
+MAX_CENTER_OFFSET = 0.2
+# Movement between frames still counted as holding still
+MAX_SHIFT = 0.05
+MAX_SIZE_CHANGE = 0.15
+
+class SessionLimit(Exception):
+    """Raised when too many camera sessions are open"""
+    pass
+
+def _box_size(box):
+    top, right, bottom, left = box
+    return right - left, bottom - top
+
+def framing_hint(box, width, height):
+    """None when the face is well framed, otherwise what the user should do"""
+    face_width, face_height = _box_size(box)
+    if face_width < MIN_FACE_WIDTH * width:
+        return 'move_closer'
+    if face_width > MAX_FACE_WIDTH * width:
+        return 'move_back'
+    top, right, bottom, left = box
+    if top <= 0 or left <= 0 or right >= width or bottom >= height:
+        return 'center_face'
+    center_x = (left + right) / 2 / width
+    center_y = (top + bottom) / 2 / height
+    if abs(center_x - 0.5) > MAX_CENTER_OFFSET or abs(center_y - 0.5) > MAX_CENTER_OFFSET:
+        return 'center_face'
+    return None
+
+def is_steady(previous, box, width):
+    """Whether the face moved and resized little enough since the previous frame"""
+    if previous is None:
+        return False
+    shift = max(abs(previous[3] - box[3]), abs(previous[0] - box[0])) / width
+    previous_width, _ = _box_size(previous)
+    box_width, _ = _box_size(box)
+    size_change = abs(box_width - previous_width) / max(previous_width, 1)
+    return shift <= MAX_SHIFT and size_change <= MAX_SIZE_CHANGE
+
+class FaceTrackingSession:
+    """Per-camera state: detect once, then follow the face with template matching.
+
+    Full face detection runs on the first frame, whenever the match score drops
+    below FACE_TRACK_MIN_CONFIDENCE, and every FACE_REDETECT_INTERVAL frames; the
+    frames in between only cost a matchTemplate over a small search window.
+    """
+
+    def __init__(self, detection_options=None, stable_frames=FACE_STREAM_STABLE_FRAMES,
+                 min_confidence=FACE_TRACK_MIN_CONFIDENCE, redetect_interval=FACE_REDETECT_INTERVAL):
+        self.session_id = uuid.uuid4().hex
+        self.detection_options = detection_options or {}
+        self.stable_frames = stable_frames
+        self.min_confidence = min_confidence
+        self.redetect_interval = max(1, redetect_interval)
+
+        self.frames = 0
+        self.detections = 0
+        self.stable_count = 0
+        self.done = False
+        self.last_seen = time.monotonic()
+
+        self._box = None
+        self._template = None
+        self._since_detection = 0
+        self._lock = threading.Lock()
+
+    def _detect(self, image, gray):
+        self.detections += 1
+        self._since_detection = 0
+        face_locations, _ = detect_faces(image, **self.detection_options)
+        if not face_locations:
+            self._box = self._template = None
+            return None, 0
+        box = largest_face(face_locations)
+        top, right, bottom, left = box
+        self._template = gray[top:bottom, left:right].copy()
+        return box, len(face_locations)
+
+    def _track(self, gray):
+        """Find the template near the previous box; returns (box, confidence)"""
+        top, right, bottom, left = self._box
+        face_width, face_height = right - left, bottom - top
+        height, width = gray.shape[:2]
+        # Search a window of half a face in every direction
+        window_top = max(0, top - face_height // 2)
+        window_left = max(0, left - face_width // 2)
+        window = gray[window_top:min(height, bottom + face_height // 2),
+                      window_left:min(width, right + face_width // 2)]
+        if window.shape[0] < face_height or window.shape[1] < face_width:
+            return None, 0.0
+
+        scores = cv2.matchTemplate(window, self._template, cv2.TM_CCOEFF_NORMED)
+        _, confidence, _, (x, y) = cv2.minMaxLoc(scores)
+        new_top, new_left = window_top + y, window_left + x
+        return (new_top, new_left + face_width, new_top + face_height, new_left), float(confidence)
+
+    def process_frame(self, image):
+        """Update the session with one RGB frame and return the capture feedback"""
+        with self._lock:
+            self.frames += 1
+            self.last_seen = time.monotonic()
+            height, width = image.shape[:2]
+            gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+            previous = self._box
+
+            box, confidence, method, faces_found = None, 0.0, 'track', 1
+            self._since_detection += 1
+            if self._box is not None and self._template is not None and self._since_detection < self.redetect_interval:
+                box, confidence = self._track(gray)
+            if box is None or confidence < self.min_confidence:
+                method = 'detect'
+                box, faces_found = self._detect(image, gray)
+                confidence = 1.0 if box is not None else 0.0
+            self._box = box
+
+            if box is None:
+                hint = 'no_face'
+            else:
+                hint = framing_hint(box, width, height)
+                if hint is None and not is_steady(previous, box, width):
+                    hint = 'hold_still'
+            self.stable_count = self.stable_count + 1 if hint is None else 0
+            self.done = self.done or self.stable_count >= self.stable_frames
+
+            return {
+                'session_id': self.session_id,
+                'frame': self.frames,
+                'method': method,
+                'confidence': round(confidence, 3),
+                'faces_found': faces_found if box is not None else 0,
+                'box': dict(zip(('top', 'right', 'bottom', 'left'), map(int, box))) if box is not None else None,
+                'hint': hint,
+                'stable_count': self.stable_count,
+                'done': self.done,
+                'detections': self.detections
+            }
+
+class SessionStore:
+    """Open camera sessions, dropped after FACE_STREAM_SESSION_TTL seconds without frames"""
+
+    def __init__(self, ttl=FACE_STREAM_SESSION_TTL, max_sessions=FACE_STREAM_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._counters = {'sessions': 0, 'completed': 0, 'frames': 0, 'detections': 0}
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.ttl
+        for session_id in [key for key, session in self._sessions.items() if session.last_seen < cutoff]:
+            self._close(session_id)
+
+    def _close(self, session_id):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._counters['frames'] += session.frames
+            self._counters['detections'] += session.detections
+            self._counters['completed'] += 1 if session.done else 0
+        return session
+
+    def create(self, detection_options=None):
+        with self._lock:
+            self._expire()
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionLimit('Too many camera sessions are open, please retry shortly')
+            session = FaceTrackingSession(detection_options)
+            self._sessions[session.session_id] = session
+            self._counters['sessions'] += 1
+            return session
+
+    def get(self, session_id):
+        with self._lock:
+            self._expire()
+            return self._sessions.get(session_id)
+
+    def close(self, session_id):
+        with self._lock:
+            return self._close(session_id)
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot['open'] = len(self._sessions)
+        return snapshot
+
+# Shared session store
+face_sessions = SessionStore()
@@ -0,0 +1,254 @@
+import re
+import logging
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+# Returned by a rule for lines it does not apply to
+NO_MATCH = object()
+
+# A rule looks at one line (with the rest of the lines available for lookahead,
+# and the values other rules found on earlier lines or earlier on this line)
+# and returns a value or NO_MATCH. A rule stops at the first line it matches;
+# for each field the matched rule with the lowest priority number and a non-None
+# value wins.
+FieldRule = namedtuple('FieldRule', ['field', 'priority', 'match'])
+
+FIELDS = ('firstName', 'lastName', 'id_number', 'nationality', 'sex')
+
+class FieldExtractor:
+    """Extract document fields from OCR text in a single pass over its lines"""
+
+    def __init__(self, rules, fields=FIELDS):
+        self.fields = fields
+        # Rules run in the order given on every line; priority only decides the winner
+        self.rules = list(rules)
+
+    def extract(self, text):
+        lines = [line.strip() for line in text.split('\n') if line.strip()]
+        lowers = [line.lower() for line in lines]
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Raw OCR text:\n%s", text)
+            logger.debug("Text lines:\n%s", '\n'.join(f"{i}: {line}" for i, line in enumerate(lines)))
+
+        matched = {}
+        found = {}
+        active = list(self.rules)
+        for i in range(len(lines)):
+            if not active:
+                break
+            for rule in list(active):
+                if rule not in active:
+                    continue
+                value = rule.match(lines, lowers, i, found)
+                if value is NO_MATCH:
+                    continue
+                matched[rule] = value
+                active.remove(rule)
+                if value is not None:
+                    found.setdefault(rule.field, value)
+                    # Lower-priority rules for this field can no longer win
+                    active = [other for other in active
+                              if other.field != rule.field or other.priority < rule.priority]
+
+        data = {field: None for field in self.fields}
+        for rule in sorted(self.rules, key=lambda rule: rule.priority):
+            if data[rule.field] is None and matched.get(rule) is not None:
+                data[rule.field] = matched[rule]
+        return data
+
+# Ghana Card rules
+
+SURNAME_RE = re.compile(r'^[A-Z]+$')
+NAME_RE = re.compile(r'^[A-Z]+(\s[A-Z]+)*$')
+NAME_LABELS = ('Firstname', 'Prénoms', 'First name', 'Given name', 'Name')
+
+ID_PATTERNS = (
+    re.compile(r'(GHA[-\s]?\d+[-\s]?\d*)'),  # Ghana ID pattern
+    re.compile(r'(ID[-\s:]?\d+[-\s]?\d*)'),  # Generic ID pattern
+    re.compile(r'(\d{9,})')                  # Any sequence of 9+ digits might be an ID
+)
+
+NATIONALITY_LABELS = ('nationality', 'nation', 'citizen', 'citizenship')
+STOP_WORDS = ('the', 'and', 'for', 'with')
+
+MALE_RE = re.compile(r'\bmale\b')
+FEMALE_RE = re.compile(r'\bfemale\b')
+M_RE = re.compile(r'\bm\b')
+F_RE = re.compile(r'\bf\b')
+
+def match_last_name(lines, lowers, i, found):
+    line = lines[i]
+    if len(line) > 1 and SURNAME_RE.match(line):
+        return line
+    return NO_MATCH
+
+def match_first_name(lines, lowers, i, found):
+    line = lines[i]
+    # Surname rules run first on each line, so the surname is known by the time it shows up
+    if len(line) > 1 and NAME_RE.match(line) and line != found.get('lastName'):
+        return line.split()[0]
+    return NO_MATCH
+
+def match_first_name_after_label(lines, lowers, i, found):
+    if not any(label in lines[i] for label in NAME_LABELS):
+        return NO_MATCH
+    for j in range(i + 1, min(i + 3, len(lines))):
+        if NAME_RE.match(lines[j]) and len(lines[j]) > 1:
+            return lines[j].split()[0]
+    return NO_MATCH
+
+def match_id_number(lines, lowers, i, found):
+    for pattern in ID_PATTERNS:
+        id_match = pattern.search(lines[i])
+        if id_match:
+            return id_match.group(1).replace(' ', '')
+    return NO_MATCH
+
+def match_nationality_after_label(lines, lowers, i, found):
+    line_lower = lowers[i]
+    if not any(label in line_lower for label in NATIONALITY_LABELS):
+        return NO_MATCH
+    if 'ghana' in line_lower:
+        return 'Ghanaian'  # Covers both Ghana and Ghanaian
+
+    if i + 1 < len(lines):
+        if 'ghana' in lowers[i + 1]:
+            return 'Ghanaian'
+        # Look for capitalized words that might be nationalities
+        for word in lines[i + 1].split():
+            if word[0].isupper() and len(word) > 2 and word.lower() not in STOP_WORDS:
+                return 'Ghanaian' if word.lower() == 'ghana' else word
+    return NO_MATCH
+
+def match_nationality_anywhere(lines, lowers, i, found):
+    if 'ghana' in lowers[i]:
+        return 'Ghanaian'
+    return NO_MATCH
+
+def match_sex_after_label(lines, lowers, i, found):
+    line_lower = lowers[i]
+    if 'sex' in line_lower or 'gender' in line_lower:
+        if 'male' in line_lower and 'female' not in line_lower:
+            return 'Male'
+        if 'female' in line_lower:
+            return 'Female'
+        if ' m ' in f' {line_lower} ':
+            return 'Male'
+        if ' f ' in f' {line_lower} ':
+            return 'Female'
+
+        if i + 1 < len(lines):
+            next_line = lowers[i + 1]
+            if 'male' in next_line and 'female' not in next_line:
+                return 'Male'
+            if 'female' in next_line:
+                return 'Female'
+            if next_line == 'm':
+                return 'Male'
+            if next_line == 'f':
+                return 'Female'
+        return NO_MATCH
+
+    # Direct gender indicators
+    if line_lower in ('male', 'm'):
+        return 'Male'
+    if line_lower in ('female', 'f'):
+        return 'Female'
+    return NO_MATCH
+
+def match_sex_anywhere(lines, lowers, i, found):
+    line_lower = lowers[i]
+    if MALE_RE.search(line_lower) and not FEMALE_RE.search(line_lower):
+        return 'Male'
+    if FEMALE_RE.search(line_lower):
+        return 'Female'
+    if M_RE.search(line_lower) and not F_RE.search(line_lower):
+        return 'Male'
+    if F_RE.search(line_lower):
+        return 'Female'
+    return NO_MATCH
+
+GHANA_CARD_RULES = [
+    FieldRule('lastName', 0, match_last_name),
+    FieldRule('firstName', 0, match_first_name),
+    FieldRule('firstName', 1, match_first_name_after_label),
+    FieldRule('id_number', 0, match_id_number),
+    FieldRule('nationality', 0, match_nationality_after_label),
+    FieldRule('nationality', 1, match_nationality_anywhere),
+    FieldRule('sex', 0, match_sex_after_label),
+    FieldRule('sex', 1, match_sex_anywhere)
+]
+
+# Passport rules: the machine readable zone, falling back to the Ghana Card heuristics
+
+MRZ_NAME_RE = re.compile(r'^P[A-Z<]([A-Z]{3})([A-Z<]+)$')
+MRZ_DETAILS_RE = re.compile(r'^([A-Z0-9<]{9})[0-9<]([A-Z]{3})[0-9<]{6}[0-9<]([MF<])')
+NATIONALITY_CODES = {'GHA': 'Ghanaian', 'NGA': 'Nigerian', 'KEN': 'Kenyan', 'USA': 'American',
+                     'GBR': 'British', 'CAN': 'Canadian'}
+
+def _mrz_line(line):
+    return line.replace(' ', '').upper()
+
+def match_mrz_last_name(lines, lowers, i, found):
+    mrz = MRZ_NAME_RE.match(_mrz_line(lines[i]))
+    if not mrz:
+        return NO_MATCH
+    return mrz.group(2).split('<<')[0].replace('<', ' ').strip() or None
+
+def match_mrz_first_name(lines, lowers, i, found):
+    mrz = MRZ_NAME_RE.match(_mrz_line(lines[i]))
+    if not mrz:
+        return NO_MATCH
+    parts = mrz.group(2).split('<<')
+    given_names = parts[1].replace('<', ' ').split() if len(parts) > 1 else []
+    return given_names[0] if given_names else None
+
+def match_mrz_id_number(lines, lowers, i, found):
+    mrz = MRZ_DETAILS_RE.match(_mrz_line(lines[i]))
+    if not mrz:
+        return NO_MATCH
+    return mrz.group(1).replace('<', '') or None
+
+def match_mrz_nationality(lines, lowers, i, found):
+    mrz = MRZ_DETAILS_RE.match(_mrz_line(lines[i]))
+    if not mrz:
+        return NO_MATCH
+    return NATIONALITY_CODES.get(mrz.group(2), mrz.group(2))
+
+def match_mrz_sex(lines, lowers, i, found):
+    mrz = MRZ_DETAILS_RE.match(_mrz_line(lines[i]))
+    if not mrz:
+        return NO_MATCH
+    return {'M': 'Male', 'F': 'Female'}.get(mrz.group(3))
+
+PASSPORT_RULES = [
+    FieldRule('lastName', 0, match_mrz_last_name),
+    FieldRule('firstName', 0, match_mrz_first_name),
+    FieldRule('id_number', 0, match_mrz_id_number),
+    FieldRule('nationality', 0, match_mrz_nationality),
+    FieldRule('sex', 0, match_mrz_sex)
+] + [rule._replace(priority=rule.priority + 1) for rule in GHANA_CARD_RULES]
+
+# Student ID rules: labelled student/index numbers first, then the Ghana Card heuristics
+
+STUDENT_ID_RE = re.compile(r'(?:student\s*id|index\s*no|id\s*no)\.?\s*[:#-]?\s*([A-Z0-9][A-Z0-9/-]{4,})', re.IGNORECASE)
+
+def match_student_id_number(lines, lowers, i, found):
+    id_match = STUDENT_ID_RE.search(lines[i])
+    if id_match:
+        return id_match.group(1)
+    return NO_MATCH
+
+STUDENT_ID_RULES = [FieldRule('id_number', 0, match_student_id_number)] + [
+    rule._replace(priority=rule.priority + 1) if rule.field == 'id_number' else rule
+    for rule in GHANA_CARD_RULES
+]
+
+# Extractors per document type
+EXTRACTORS = {
+    'ghana_card': FieldExtractor(GHANA_CARD_RULES),
+    'passport': FieldExtractor(PASSPORT_RULES),
+    'student_id': FieldExtractor(STUDENT_ID_RULES)
+}
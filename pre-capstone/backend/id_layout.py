@@ -0,0 +1,195 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from ocr_engine import run_ocr, filter_words
+
+# Deskewed card size: ID-1 format (85.6 x 54 mm) at roughly 300 DPI
+CARD_WIDTH = 1012
+CARD_HEIGHT = 638
+CARD_ASPECT = CARD_WIDTH / CARD_HEIGHT
+
+# Longest side used while searching for the card outline
+DETECTION_MAX_DIMENSION = 800
+
+# The card must cover at least this fraction of the photo to be trusted
+MIN_CARD_AREA_RATIO = 0.2
+
+# Field crops are OCR'd concurrently on this many threads (1 disables the pool)
+OCR_FIELD_WORKERS = int(os.getenv("OCR_FIELD_WORKERS", "5"))
+
+UPPERCASE = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+# Field zones on the front of the Ghana Card as (left, top, right, bottom)
+# fractions of the deskewed card. The value lines sit to the right of the
+# portrait, under their bilingual labels.
+GHANA_CARD_FIELDS = {
+    'lastName': {'zone': (0.31, 0.27, 0.80, 0.35), 'psm': 7, 'whitelist': UPPERCASE + "-'"},
+    'firstName': {'zone': (0.31, 0.38, 0.95, 0.46), 'psm': 7, 'whitelist': UPPERCASE + "-'"},
+    'nationality': {'zone': (0.31, 0.49, 0.62, 0.57), 'psm': 7, 'whitelist': UPPERCASE},
+    'sex': {'zone': (0.63, 0.49, 0.78, 0.57), 'psm': 8, 'whitelist': 'MF'},
+    'id_number': {'zone': (0.04, 0.86, 0.50, 0.95), 'psm': 7, 'whitelist': 'GHA-0123456789'}
+}
+
+def order_corners(points):
+    """Order four points as top-left, top-right, bottom-right, bottom-left"""
+    points = points.reshape(4, 2).astype(np.float32)
+    sums = points.sum(axis=1)
+    diffs = np.diff(points, axis=1).ravel()
+    return np.array([
+        points[np.argmin(sums)],
+        points[np.argmin(diffs)],
+        points[np.argmax(sums)],
+        points[np.argmax(diffs)]
+    ], dtype=np.float32)
+
+def find_card_quad(gray, min_area_ratio=MIN_CARD_AREA_RATIO):
+    """Find the card outline in a grayscale image, or None if no card-like quadrilateral is found"""
+    height, width = gray.shape[:2]
+    scale = min(1.0, DETECTION_MAX_DIMENSION / max(height, width))
+    small = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+
+    blurred = cv2.GaussianBlur(small, (5, 5), 0)
+    edges = cv2.Canny(blurred, 50, 150)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8), iterations=1)
+
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = min_area_ratio * small.shape[0] * small.shape[1]
+
+    for contour in sorted(contours, key=cv2.contourArea, reverse=True):
+        area = cv2.contourArea(contour)
+        if area < min_area:
+            break
+        approx = cv2.approxPolyDP(contour, 0.02 * cv2.arcLength(contour, True), True)
+        if len(approx) == 4 and cv2.isContourConvex(approx):
+            return order_corners(approx) / scale
+
+    return None
+
+def deskew_card(image):
+    """Locate the card in an RGB or grayscale array and warp it to the canonical card size"""
+    gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY) if image.ndim == 3 else image
+    corners = find_card_quad(gray)
+
+    if corners is None:
+        # Accept photos that are already cropped to the card
+        height, width = gray.shape[:2]
+        if abs(width / height - CARD_ASPECT) > 0.15:
+            return None
+        return cv2.resize(image, (CARD_WIDTH, CARD_HEIGHT), interpolation=cv2.INTER_AREA)
+
+    top_left, top_right, bottom_right, bottom_left = corners
+    edge_width = np.linalg.norm(top_right - top_left)
+    edge_height = np.linalg.norm(bottom_left - top_left)
+
+    # A card photographed sideways: rotate the corner order so the long edge is horizontal
+    if edge_height > edge_width:
+        corners = np.array([bottom_left, top_left, top_right, bottom_right], dtype=np.float32)
+
+    target = np.array([
+        [0, 0],
+        [CARD_WIDTH - 1, 0],
+        [CARD_WIDTH - 1, CARD_HEIGHT - 1],
+        [0, CARD_HEIGHT - 1]
+    ], dtype=np.float32)
+    transform = cv2.getPerspectiveTransform(corners, target)
+    return cv2.warpPerspective(image, transform, (CARD_WIDTH, CARD_HEIGHT))
+
+def crop_fields(card, fields=GHANA_CARD_FIELDS):
+    """Crop every field zone out of a deskewed card"""
+    height, width = card.shape[:2]
+    crops = {}
+    for name, spec in fields.items():
+        left, top, right, bottom = spec['zone']
+        crops[name] = card[int(top * height):int(bottom * height), int(left * width):int(right * width)]
+    return crops
+
+def normalize_field(name, value):
+    """Turn raw zone text into the values extract_id_card_data produces"""
+    value = ' '.join(value.split())
+    if not value:
+        return None
+
+    if name == 'firstName':
+        return value.split()[0]
+    if name == 'nationality':
+        return 'Ghanaian' if 'GHANA' in value.upper() else value.title()
+    if name == 'sex':
+        if value.upper().startswith('M'):
+            return 'Male'
+        if value.upper().startswith('F'):
+            return 'Female'
+        return None
+    if name == 'id_number':
+        return value.replace(' ', '')
+    return value
+
+def ocr_field(name, crop, fields=GHANA_CARD_FIELDS):
+    """OCR a single field crop with the zone's page segmentation mode and whitelist"""
+    spec = fields[name]
+    return run_ocr(crop, psm=spec['psm'], whitelist=spec['whitelist'])
+
+# Shared pool for field OCR. Tesseract runs outside the GIL, so threads are enough.
+field_executor = (
+    ThreadPoolExecutor(max_workers=OCR_FIELD_WORKERS, thread_name_prefix='ocr-field')
+    if OCR_FIELD_WORKERS > 1 else None
+)
+
+def configure_field_workers(workers):
+    """Replace the shared field pool; 1 or fewer OCRs the fields one after another"""
+    global field_executor
+    previous = field_executor
+    field_executor = (
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ocr-field')
+        if workers > 1 else None
+    )
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+def ocr_fields(crops, fields=GHANA_CARD_FIELDS, executor=None):
+    """OCR all field crops, concurrently when an executor is available"""
+    executor = executor or field_executor
+    if executor is None:
+        return {name: ocr_field(name, crop, fields) for name, crop in crops.items()}
+
+    futures = {name: executor.submit(ocr_field, name, crop, fields) for name, crop in crops.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+def process_card_layout(image, fields=GHANA_CARD_FIELDS, executor=None):
+    """OCR only the known field zones of an ID card.
+
+    Returns a result shaped like process_ocr's data, or None when no card could be located.
+    """
+    card = deskew_card(image)
+    if card is None:
+        return None
+
+    crops = crop_fields(card, fields)
+    field_results = ocr_fields(crops, fields, executor)
+
+    extracted = {
+        'firstName': None,
+        'lastName': None,
+        'id_number': None,
+        'nationality': None,
+        'sex': None
+    }
+    lines = []
+    filtered_text = []
+    confidence = []
+    for name, result in field_results.items():
+        raw_value = result['text'].strip()
+        extracted[name] = normalize_field(name, raw_value)
+        if raw_value:
+            lines.append(' '.join(raw_value.split()))
+        filtered_text.extend(filter_words(result['words']))
+        confidence.extend(result['confidence'])
+
+    return {
+        'text': '\n'.join(lines),
+        'filtered_text': ' '.join(filtered_text),
+        'extracted': extracted,
+        'confidence': confidence
+    }
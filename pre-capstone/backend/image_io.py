@@ -0,0 +1,79 @@
+import os
+from io import BytesIO
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+# Photos with a longer side than this are decoded at 1/2, 1/4 or 1/8 scale
+IMAGE_DECODE_MAX_DIMENSION = int(os.getenv("IMAGE_DECODE_MAX_DIMENSION", "2000"))
+
+# Reduced-size decode flags; for JPEG, libjpeg scales during DCT decoding
+REDUCED_COLOR_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8
+}
+
+class ImageDecodeError(ValueError):
+    """Raised when upload bytes are not an image we can read"""
+    pass
+
+def image_size(image_bytes):
+    """Read (width, height) from the image header without decoding pixels"""
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            return image.size
+    except Exception:
+        return None
+
+def reduction_factor(size, max_dimension=IMAGE_DECODE_MAX_DIMENSION):
+    """Largest power-of-two reduction that keeps the longer side at or above max_dimension"""
+    if not size or not max_dimension:
+        return 1
+    factor = 1
+    while factor < 8 and max(size) / (factor * 2) >= max_dimension:
+        factor *= 2
+    return factor
+
+def decode_image(image_bytes, max_dimension=IMAGE_DECODE_MAX_DIMENSION):
+    """Decode upload bytes straight into an RGB array, EXIF orientation applied.
+
+    The request buffer is wrapped with np.frombuffer (no copy) and decoded by
+    OpenCV, at reduced size for large photos. The single array returned is
+    shared by the OCR and face stages.
+    """
+    buffer = np.frombuffer(image_bytes, dtype=np.uint8)
+    factor = reduction_factor(image_size(image_bytes), max_dimension)
+    image = cv2.imdecode(buffer, REDUCED_COLOR_FLAGS.get(factor, cv2.IMREAD_COLOR))
+
+    if image is None:
+        # Formats OpenCV cannot read (e.g. GIF) go through Pillow instead
+        try:
+            pil_image = ImageOps.exif_transpose(Image.open(BytesIO(image_bytes)))
+        except Exception:
+            raise ImageDecodeError('Could not decode image')
+        return np.array(pil_image.convert('RGB'))
+
+    # One in-place channel swap; everything downstream works in RGB
+    return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=image)
+
+def upload_scale(image_bytes, image):
+    """Factor from the decoded array's pixels to the upload's: about 2, 4 or 8 after a reduced decode, else 1"""
+    size = image_size(image_bytes)
+    if not size:
+        return 1.0
+    # Compare longer sides, which EXIF rotation does not change
+    return max(size) / max(image.shape[:2])
+
+def image_extension(image_bytes):
+    """File extension for the encoded image bytes"""
+    if image_bytes[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if image_bytes[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return 'webp'
+    if image_bytes[:6] in (b'GIF87a', b'GIF89a'):
+        return 'gif'
+    return 'bin'
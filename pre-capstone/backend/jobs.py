@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import itertools
+import threading
+import urllib.request
+
+from cryptography.fernet import InvalidToken
+
+from db_config import encrypt_data, decrypt_data
+from background import BackgroundWorkers
+
+# Job queue configuration
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_MAX_QUEUE = int(os.getenv("JOBS_MAX_QUEUE", "100"))
+JOBS_RESULT_TTL = float(os.getenv("JOBS_RESULT_TTL", "300"))
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "")
+JOBS_MAX_WAIT = float(os.getenv("JOBS_MAX_WAIT", "30"))
+JOBS_ALLOW_CALLBACKS = os.getenv("JOBS_ALLOW_CALLBACKS", "false").lower() in ('1', 'true', 'yes')
+
+# Lower value runs first; interactive traffic overtakes queued bulk work
+PRIORITIES = {'interactive': 0, 'bulk': 1}
+
+FINISHED_STATUSES = ('done', 'failed')
+
+class QueueFull(Exception):
+    """Raised when the job queue has no room left"""
+    pass
+
+class MemoryJobStore:
+    """Jobs kept in a dict; lost on restart"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job, payload):
+        with self._lock:
+            self._jobs[job['job_id']] = dict(job, payload=payload)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return {key: value for key, value in job.items() if key != 'payload'} if job else None
+
+    def get_payload(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job['payload'] if job else None
+
+    def unfinished(self):
+        return []
+
+    def purge(self, finished_before):
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['status'] in FINISHED_STATUSES and job['updated_at'] < finished_before]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+class SQLiteJobStore:
+    """Jobs kept in a local SQLite file so queued work survives restarts.
+
+    Payloads and results contain images and personal data, so both are stored encrypted.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                priority TEXT NOT NULL,
+                callback_url TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                payload BLOB,
+                result BLOB,
+                error TEXT
+            )
+        """)
+        self._connection.execute("CREATE INDEX IF NOT EXISTS ix_jobs_status_updated ON jobs (status, updated_at)")
+        self._connection.commit()
+
+    def create(self, job, payload):
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO jobs (job_id, status, priority, callback_url, created_at, updated_at, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job['job_id'], job['status'], job['priority'], job['callback_url'],
+                 job['created_at'], job['updated_at'], encrypt_data(json.dumps(payload)))
+            )
+            self._connection.commit()
+
+    def update(self, job_id, **fields):
+        if 'result' in fields and fields['result'] is not None:
+            fields['result'] = encrypt_data(json.dumps(fields['result']))
+        # Finished jobs no longer need the uploaded image
+        if fields.get('status') in FINISHED_STATUSES:
+            fields['payload'] = None
+        assignments = ', '.join(f'{column} = ?' for column in fields)
+        with self._lock:
+            self._connection.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?",
+                                     list(fields.values()) + [job_id])
+            self._connection.commit()
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT job_id, status, priority, callback_url, created_at, updated_at, result, error "
+                "FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        job = dict(zip(('job_id', 'status', 'priority', 'callback_url', 'created_at', 'updated_at', 'result', 'error'), row))
+        if job['result'] is not None:
+            try:
+                job['result'] = json.loads(decrypt_data(job['result']))
+            except InvalidToken:
+                job['result'] = None
+                job['error'] = 'Result was encrypted with a different key'
+        return job
+
+    def get_payload(self, job_id):
+        with self._lock:
+            row = self._connection.execute("SELECT payload FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        try:
+            return json.loads(decrypt_data(row[0]))
+        except InvalidToken:
+            return None
+
+    def unfinished(self):
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT job_id, priority FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            ).fetchall()
+        return rows
+
+    def purge(self, finished_before):
+        with self._lock:
+            cursor = self._connection.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?", (finished_before,)
+            )
+            self._connection.commit()
+        return cursor.rowcount
+
+class JobQueue(BackgroundWorkers):
+    """Local priority job queue with a thread pool of workers and long-poll support"""
+
+    def __init__(self, handler, workers=JOBS_WORKERS, max_queue=JOBS_MAX_QUEUE,
+                 result_ttl=JOBS_RESULT_TTL, db_path=JOBS_DB_PATH):
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self.store = SQLiteJobStore(db_path) if db_path else MemoryJobStore()
+
+        super().__init__(('submitted', 'completed', 'failed', 'rejected'), 'job-worker', threads=self.workers)
+        self._queue = queue.PriorityQueue()
+        self._sequence = itertools.count()
+        self._finished = threading.Condition()
+
+    def _on_start(self):
+        # Pick up jobs that were queued or interrupted before a restart
+        for job_id, priority in self.store.unfinished():
+            self.store.update(job_id, status='queued', updated_at=time.time())
+            self._queue.put((PRIORITIES.get(priority, 0), next(self._sequence), job_id))
+
+    def submit(self, payload, priority='interactive', callback_url=None):
+        """Queue a job and return its id immediately"""
+        if priority not in PRIORITIES:
+            raise ValueError(f'Unsupported priority: {priority}')
+        self._start()
+        if self._queue.qsize() >= self.max_queue:
+            self._count('rejected')
+            raise QueueFull('Job queue is full, please retry shortly')
+
+        now = time.time()
+        self.store.purge(now - self.result_ttl)
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'status': 'queued',
+            'priority': priority,
+            'callback_url': callback_url,
+            'created_at': now,
+            'updated_at': now,
+            'result': None,
+            'error': None
+        }
+        self.store.create(job, payload)
+        self._queue.put((PRIORITIES[priority], next(self._sequence), job['job_id']))
+        self._count('submitted')
+        return job['job_id']
+
+    def get(self, job_id, wait=0):
+        """Return the job, waiting up to wait seconds for it to finish"""
+        deadline = time.monotonic() + min(max(wait, 0), JOBS_MAX_WAIT)
+        with self._finished:
+            while True:
+                job = self.store.get(job_id)
+                remaining = deadline - time.monotonic()
+                if job is None or job['status'] in FINISHED_STATUSES or remaining <= 0:
+                    return job
+                self._finished.wait(remaining)
+
+    def _work(self):
+        while True:
+            _, _, job_id = self._queue.get()
+            try:
+                self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id):
+        payload = self.store.get_payload(job_id)
+        if payload is None:
+            self._finish(job_id, status='failed', error='Job payload is no longer available')
+            return
+
+        self.store.update(job_id, status='running', updated_at=time.time())
+        try:
+            self._finish(job_id, status='done', result=self.handler(payload))
+        except Exception as e:
+            self._finish(job_id, status='failed', error=str(e))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        self.store.update(job_id, status=status, result=result, error=error, updated_at=time.time())
+        self._count('completed' if status == 'done' else 'failed')
+        with self._finished:
+            self._finished.notify_all()
+
+        job = self.store.get(job_id)
+        if job and job['callback_url'] and JOBS_ALLOW_CALLBACKS:
+            self._send_callback(job)
+
+    def _send_callback(self, job):
+        request = urllib.request.Request(
+            job['callback_url'],
+            data=json.dumps(job).encode(),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        try:
+            urllib.request.urlopen(request, timeout=5).close()
+        except Exception as e:
+            print(f"Job callback to {job['callback_url']} failed: {e}")
+
+    def stats(self):
+        snapshot = self._counters_snapshot()
+        snapshot.update({'queued': self._queue.qsize(), 'workers': self.workers})
+        return snapshot
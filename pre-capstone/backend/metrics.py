@@ -0,0 +1,186 @@
+import os
+import time
+import random
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Request metrics (latency, in-flight, errors) are cheap and always on unless disabled;
+# per-stage timings are recorded for a sampled fraction of requests
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ('1', 'true', 'yes')
+METRICS_SAMPLE_RATE = float(os.getenv("METRICS_SAMPLE_RATE", "1.0"))
+
+# Clients may ask for a Server-Timing breakdown with an 'X-Server-Timing: 1' request header
+SERVER_TIMING_ENABLED = os.getenv("SERVER_TIMING_ENABLED", "false").lower() in ('1', 'true', 'yes')
+SERVER_TIMING_REQUEST_HEADER = 'X-Server-Timing'
+
+# Seconds; covers sub-millisecond parsing up to slow OCR on large photos
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _format_labels(label_names, labels, extra=None):
+    pairs = list(zip(label_names, labels))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name, documentation, label_names=()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self, kind='counter'):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {kind}']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.label_names, labels)} {_format_value(value)}')
+        return lines
+
+class Gauge(Counter):
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def render(self):
+        return super().render(kind='gauge')
+
+class Histogram:
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts (last one is +Inf), sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][position] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += bucket_count
+                    le = bound if bound == '+Inf' else _format_value(float(bound))
+                    lines.append(f'{self.name}_bucket{_format_labels(self.label_names, labels, ("le", le))} {cumulative}')
+                lines.append(f'{self.name}_sum{_format_labels(self.label_names, labels)} {_format_value(total)}')
+                lines.append(f'{self.name}_count{_format_labels(self.label_names, labels)} {count}')
+        return lines
+
+REQUEST_SECONDS = Histogram('verification_request_seconds', 'Request latency by endpoint', ('endpoint', 'method'))
+REQUESTS_IN_FLIGHT = Gauge('verification_requests_in_flight', 'Requests currently being handled', ('endpoint',))
+REQUEST_ERRORS = Counter('verification_request_errors_total', 'Responses with a 4xx or 5xx status', ('endpoint', 'status'))
+STAGE_SECONDS = Histogram('verification_stage_seconds', 'Time spent in each processing stage (sampled)', ('stage',))
+
+METRICS = [REQUEST_SECONDS, REQUESTS_IN_FLIGHT, REQUEST_ERRORS, STAGE_SECONDS]
+
+# Callables returning [(name, help, value)] gauges, or (name, help, value, 'counter') for
+# running totals kept elsewhere (named *_total), read when /metrics is scraped
+_collectors = []
+
+def register_collector(collector):
+    _collectors.append(collector)
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        try:
+            for name, documentation, value, *kind in collector():
+                kind = kind[0] if kind else 'gauge'
+                lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} {kind}', f'{name} {_format_value(value)}'])
+        except Exception as e:
+            print(f"Metrics collector failed: {e}")
+    return '\n'.join(lines) + '\n'
+
+class Trace:
+    """Stage timings of one sampled request"""
+
+    def __init__(self, server_timing=False):
+        self.server_timing = server_timing
+        self.stages = []
+
+    def server_timing_header(self, total_seconds):
+        durations = {}
+        for name, seconds in self.stages:
+            durations[name] = durations.get(name, 0.0) + seconds
+        entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in durations.items()]
+        entries.append(f'total;dur={total_seconds * 1000:.1f}')
+        return ', '.join(entries)
+
+_trace = contextvars.ContextVar('metrics_trace', default=None)
+
+def begin_request(server_timing_requested=False):
+    """Start a trace for the current request if it is sampled; returns a token for end_request"""
+    server_timing = server_timing_requested and SERVER_TIMING_ENABLED
+    sampled = METRICS_ENABLED and (server_timing or random.random() < METRICS_SAMPLE_RATE)
+    return _trace.set(Trace(server_timing) if sampled else None)
+
+def end_request(token):
+    try:
+        _trace.reset(token)
+    except ValueError:
+        # Finished in a different context (e.g. a streamed response); just clear it
+        _trace.set(None)
+
+def current_trace():
+    return _trace.get()
+
+def wants_server_timing(headers):
+    return headers.get(SERVER_TIMING_REQUEST_HEADER, '').lower() in ('1', 'true', 'yes')
+
+class _NoStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+_NO_STAGE = _NoStage()
+
+@contextmanager
+def _timed_stage(trace, name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        trace.stages.append((name, elapsed))
+        STAGE_SECONDS.observe(elapsed, name)
+
+def stage(name):
+    """Time a block as a named stage; a no-op unless the current request is sampled"""
+    trace = _trace.get()
+    if trace is None:
+        return _NO_STAGE
+    return _timed_stage(trace, name)
+
+def observe_request(endpoint, method, status, seconds):
+    if not METRICS_ENABLED:
+        return
+    REQUEST_SECONDS.observe(seconds, endpoint, method)
+    if status >= 400:
+        REQUEST_ERRORS.inc(endpoint, str(status))
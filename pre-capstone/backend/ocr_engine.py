@@ -0,0 +1,234 @@
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+import pytesseract
+from PIL import Image
+
+# tesserocr is in requirements.txt; pytesseract remains as a fallback where it cannot be built
+try:
+    import tesserocr
+    TESSEROCR_AVAILABLE = True
+except ImportError:
+    TESSEROCR_AVAILABLE = False
+    print("Warning: tesserocr module not available. OCR will start a tesseract process per call.")
+
+# Default page segmentation mode used for full-page ID card OCR
+DEFAULT_PSM = 3
+
+# Words below this confidence are dropped from the filtered text
+MIN_WORD_CONFIDENCE = 60
+
+# Worker pool configuration
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+OCR_POOL_SIZE = int(os.getenv("OCR_POOL_SIZE", os.cpu_count() or 2))
+OCR_QUEUE_LIMIT = int(os.getenv("OCR_QUEUE_LIMIT", "16"))
+OCR_QUEUE_TIMEOUT = float(os.getenv("OCR_QUEUE_TIMEOUT", "30"))
+
+# Columns of Tesseract's TSV output, in order
+TSV_COLUMNS = ['level', 'page_num', 'block_num', 'par_num', 'line_num', 'word_num',
+               'left', 'top', 'width', 'height', 'conf', 'text']
+
+class OCRPoolBusy(Exception):
+    """Raised when the OCR pool queue is full or a worker did not free up in time"""
+    pass
+
+def build_config(psm=DEFAULT_PSM, whitelist=None):
+    """Build a Tesseract command line config string"""
+    config = f'--psm {psm}'
+    if whitelist:
+        config += f' -c tessedit_char_whitelist={whitelist}'
+    return config
+
+def rebuild_text(ocr_data):
+    """Rebuild plain text from word-level OCR data, laid out the way image_to_string does"""
+    paragraphs = []
+    current_paragraph = None
+    current_line = None
+
+    for i in range(len(ocr_data['text'])):
+        word = ocr_data['text'][i]
+        if not word or not word.strip():
+            continue
+
+        paragraph_key = (ocr_data['page_num'][i], ocr_data['block_num'][i], ocr_data['par_num'][i])
+        if current_paragraph is None or current_paragraph[0] != paragraph_key:
+            current_paragraph = (paragraph_key, [])
+            paragraphs.append(current_paragraph)
+            current_line = None
+
+        line_key = ocr_data['line_num'][i]
+        if current_line is None or current_line[0] != line_key:
+            current_line = (line_key, [])
+            current_paragraph[1].append(current_line)
+
+        current_line[1].append(word)
+
+    # Tesseract separates paragraphs with a blank line and ends the page with a form feed
+    text = ''.join(
+        '\n'.join(' '.join(words) for _, words in lines) + '\n\n'
+        for _, lines in paragraphs
+    )
+    return text + '\f'
+
+def filter_words(ocr_data, min_confidence=MIN_WORD_CONFIDENCE):
+    """Return the words whose confidence is above the threshold"""
+    filtered_text = []
+    for i in range(len(ocr_data['text'])):
+        if int(float(ocr_data['conf'][i])) > min_confidence and ocr_data['text'][i].strip():
+            filtered_text.append(ocr_data['text'][i])
+    return filtered_text
+
+def parse_tsv(tsv):
+    """Parse Tesseract TSV output into the same dict layout as pytesseract.Output.DICT"""
+    ocr_data = {column: [] for column in TSV_COLUMNS}
+    for row in tsv.splitlines():
+        values = row.split('\t')
+        if len(values) < len(TSV_COLUMNS) - 1 or values[0] == 'level':
+            continue
+        # Rows that are not words have no text column
+        if len(values) == len(TSV_COLUMNS) - 1:
+            values.append('')
+        for column, value in zip(TSV_COLUMNS, values):
+            if column == 'text':
+                ocr_data[column].append(value)
+            elif column == 'conf':
+                ocr_data[column].append(float(value))
+            else:
+                ocr_data[column].append(int(value))
+    return ocr_data
+
+class OCRWorkerPool:
+    """Long-lived pool of Tesseract workers with bounded queueing.
+
+    With tesserocr installed every worker keeps a PyTessBaseAPI handle with the
+    language data loaded; Tesseract releases the GIL while recognising, so the
+    handles run in parallel on the calling threads. Without tesserocr there are
+    no warm workers: every call starts a new tesseract process, and the pool only
+    bounds how many run at once.
+    """
+
+    def __init__(self, size=OCR_POOL_SIZE, queue_limit=OCR_QUEUE_LIMIT,
+                 queue_timeout=OCR_QUEUE_TIMEOUT, language=OCR_LANGUAGE):
+        self.size = max(1, size)
+        self.queue_limit = max(0, queue_limit)
+        self.queue_timeout = queue_timeout
+        self.language = language
+        self.backend = 'tesserocr' if TESSEROCR_AVAILABLE else 'pytesseract'
+
+        # Requests beyond the running workers plus the queue limit are rejected immediately
+        self._admission = threading.BoundedSemaphore(self.size + self.queue_limit)
+        self._workers = queue.LifoQueue()
+        for _ in range(self.size):
+            self._workers.put(None)  # Placeholder, the API handle is created on first use
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'busy': 0,
+            'queued': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected': 0,
+            'wait_seconds_total': 0.0,
+            'run_seconds_total': 0.0
+        }
+
+    def _update(self, **deltas):
+        with self._lock:
+            for key, delta in deltas.items():
+                self._stats[key] += delta
+
+    def _create_worker(self):
+        if TESSEROCR_AVAILABLE:
+            return tesserocr.PyTessBaseAPI(lang=self.language)
+        return None
+
+    def _recognize(self, worker, image, psm, whitelist):
+        if worker is None:
+            return pytesseract.image_to_data(
+                image,
+                lang=self.language,
+                config=build_config(psm, whitelist),
+                output_type=pytesseract.Output.DICT
+            )
+
+        # tesserocr only takes PIL images
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image)
+        elif image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        worker.SetPageSegMode(psm)
+        worker.SetVariable('tessedit_char_whitelist', whitelist or '')
+        worker.SetImage(image)
+        try:
+            worker.Recognize()
+            return parse_tsv(worker.GetTSVText(0))
+        finally:
+            worker.Clear()
+
+    def run(self, image, psm=DEFAULT_PSM, whitelist=None):
+        """Run OCR on a pooled worker and return pytesseract-style word data"""
+        if not self._admission.acquire(blocking=False):
+            self._update(rejected=1)
+            raise OCRPoolBusy('OCR queue is full, please retry shortly')
+
+        try:
+            self._update(queued=1)
+            wait_start = time.perf_counter()
+            try:
+                worker = self._workers.get(timeout=self.queue_timeout)
+            except queue.Empty:
+                self._update(queued=-1, rejected=1)
+                raise OCRPoolBusy('Timed out waiting for an OCR worker')
+            self._update(queued=-1, busy=1, wait_seconds_total=time.perf_counter() - wait_start)
+
+            run_start = time.perf_counter()
+            try:
+                if worker is None:
+                    worker = self._create_worker()
+                ocr_data = self._recognize(worker, image, psm, whitelist)
+                self._update(completed=1)
+                return ocr_data
+            except Exception:
+                self._update(failed=1)
+                raise
+            finally:
+                self._update(busy=-1, run_seconds_total=time.perf_counter() - run_start)
+                self._workers.put(worker)
+        finally:
+            self._admission.release()
+
+    def stats(self):
+        """Return a snapshot of pool counters"""
+        with self._lock:
+            snapshot = dict(self._stats)
+        snapshot.update({
+            'backend': self.backend,
+            'size': self.size,
+            'queue_limit': self.queue_limit,
+            'idle': self._workers.qsize()
+        })
+        return snapshot
+
+# Shared pool used by the Flask app
+ocr_pool = OCRWorkerPool()
+
+def configure_pool(size):
+    """Replace the shared pool with one of the given size, e.g. a single worker per batch process"""
+    global ocr_pool
+    ocr_pool = OCRWorkerPool(size=size)
+    return ocr_pool
+
+def run_ocr(image, psm=DEFAULT_PSM, whitelist=None):
+    """Run Tesseract once and derive text, filtered text and confidences from the word boxes"""
+    ocr_data = ocr_pool.run(image, psm=psm, whitelist=whitelist)
+
+    return {
+        'text': rebuild_text(ocr_data),
+        'filtered_text': ' '.join(filter_words(ocr_data)),
+        'confidence': ocr_data['conf'],
+        'words': ocr_data
+    }
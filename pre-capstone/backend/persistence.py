@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import uuid
+import queue
+from datetime import datetime, timedelta, timezone
+
+from db_config import engine, init_db, blind_index, VerificationRecord, get_face_index
+from record_codec import encrypt_record
+from background import BackgroundWorkers
+
+# Write-behind persistence of verification records
+PERSIST_VERIFICATIONS = os.getenv("PERSIST_VERIFICATIONS", "true").lower() in ('1', 'true', 'yes')
+PERSIST_BATCH_SIZE = int(os.getenv("PERSIST_BATCH_SIZE", "100"))
+PERSIST_FLUSH_INTERVAL = float(os.getenv("PERSIST_FLUSH_INTERVAL", "0.5"))
+PERSIST_MAX_QUEUE = int(os.getenv("PERSIST_MAX_QUEUE", "10000"))
+PERSIST_RETRIES = int(os.getenv("PERSIST_RETRIES", "3"))
+
+# How long a verification record is kept before it expires
+VERIFICATION_RECORD_TTL = float(os.getenv("VERIFICATION_RECORD_TTL", "300"))
+
+# Form fields stored in the encrypted PII envelope, by VerificationRecord column
+PII_FORM_FIELDS = {
+    'first_name': 'firstName',
+    'last_name': 'lastName',
+    'id_number': 'idNumber',
+    'nationality': 'nationality'
+}
+
+def result_summary(verification_result):
+    """The stored form of a compare_id_data result: match flags and scores only.
+
+    The matches carry the OCR and form values themselves, which are PII and are only
+    kept in the encrypted envelope.
+    """
+    fields = [
+        {'field': entry['field'], 'match': match, 'similarity': entry.get('similarity')}
+        for key, match in (('matches', True), ('mismatches', False))
+        for entry in verification_result.get(key, [])
+    ]
+    return {
+        'overall_match': verification_result.get('overall_match'),
+        'confidence': verification_result.get('confidence'),
+        'fields': fields
+    }
+
+class VerificationWriter(BackgroundWorkers):
+    """Queues VerificationRecord inserts and writes them in batches on a background thread.
+
+    Requests only pay for encrypting the row's PII envelope and queueing it; the writer
+    groups rows into one executemany INSERT per batch (up to batch_size rows or
+    flush_interval seconds, whichever comes first).
+    """
+
+    def __init__(self, bind=engine, batch_size=PERSIST_BATCH_SIZE, flush_interval=PERSIST_FLUSH_INTERVAL,
+                 max_queue=PERSIST_MAX_QUEUE, retries=PERSIST_RETRIES, enabled=PERSIST_VERIFICATIONS):
+        self.bind = bind
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.retries = max(1, retries)
+        self.enabled = enabled
+
+        super().__init__(('queued', 'written', 'batches', 'dropped', 'failed', 'index_errors'), 'verification-writer')
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._tables_ready = False
+
+    def record(self, form_data, verification_result, id_card_hash=None, selfie_hash=None, face_encoding=None):
+        """Queue a verification record; returns its request id, or None when it was not queued"""
+        if not self.enabled:
+            return None
+
+        now = datetime.utcnow()
+        row = {
+            'request_id': uuid.uuid4().hex,
+            'selfie_hash': selfie_hash,
+            'id_card_hash': id_card_hash,
+            'verification_result': json.dumps(result_summary(verification_result)),
+            'created_at': now,
+            'expiry_time': now + timedelta(seconds=VERIFICATION_RECORD_TTL)
+        }
+        row['id_number_index'] = blind_index(form_data.get('idNumber'))
+        row['pii'] = encrypt_record({
+            column: str(form_data[field]) if form_data.get(field) else None
+            for column, field in PII_FORM_FIELDS.items()
+        })
+
+        self._start()
+        try:
+            self._queue.put_nowait((row, face_encoding))
+        except queue.Full:
+            self._count('dropped')
+            print("Warning: verification write queue is full, record dropped")
+            return None
+        self._count('queued')
+        return row['request_id']
+
+    def _work(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                self._write_with_retries(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_with_retries(self, batch):
+        for attempt in range(1, self.retries + 1):
+            try:
+                self.write_batch(batch)
+                return
+            except Exception as e:
+                if attempt == self.retries:
+                    self._count('failed', len(batch))
+                    print(f"Writing {len(batch)} verification records failed: {e}")
+                    return
+                time.sleep(min(2 ** attempt * 0.1, 5))
+
+    def write_batch(self, batch):
+        """Insert (row, face_encoding) pairs in one transaction and index the face encodings"""
+        if not self._tables_ready:
+            init_db(self.bind)
+            self._tables_ready = True
+
+        table = VerificationRecord.__table__
+        rows = [row for row, _ in batch]
+        indexed = [(row, encoding) for row, encoding in batch if encoding is not None]
+        with self.bind.begin() as connection:
+            if indexed:
+                # Record ids are only needed to key the face index
+                result = connection.execute(table.insert().returning(table.c.id, sort_by_parameter_order=True), rows)
+                record_ids = result.scalars().all()
+            else:
+                connection.execute(table.insert(), rows)
+
+        self._count('written', len(rows))
+        self._count('batches')
+
+        # The rows are committed by now, so an index failure must not send the batch back
+        # through the retries (it would insert the same request ids twice)
+        if indexed:
+            ids_by_request = {row['request_id']: record_id for row, record_id in zip(rows, record_ids)}
+            try:
+                get_face_index().add(
+                    [ids_by_request[row['request_id']] for row, _ in indexed],
+                    [encoding for _, encoding in indexed],
+                    [row['expiry_time'].replace(tzinfo=timezone.utc).timestamp() for row, _ in indexed]
+                )
+            except Exception as e:
+                self._count('index_errors', len(indexed))
+                print(f"Indexing {len(indexed)} face encodings failed: {e}")
+
+    def stats(self):
+        snapshot = self._counters_snapshot()
+        snapshot.update({'enabled': self.enabled, 'pending': self._queue.qsize()})
+        return snapshot
+
+# Shared writer instance
+verification_writer = VerificationWriter()
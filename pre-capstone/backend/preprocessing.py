@@ -0,0 +1,147 @@
+import os
+import math
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Default OCR preprocessing pipeline, e.g. "resize:300,grayscale,denoise,threshold,deskew"
+OCR_PREPROCESS = os.getenv("OCR_PREPROCESS", "resize:300")
+
+# Physical width assumed for an ID card photo (the card plus some background)
+# when converting a target DPI into a pixel size
+PHOTO_WIDTH_INCHES = 4.0
+
+def resize_to_dpi(image, dpi=300):
+    """Downscale so the longest side matches the target DPI; never upscales"""
+    target = int(float(dpi) * PHOTO_WIDTH_INCHES)
+    height, width = image.shape[:2]
+    scale = target / max(height, width)
+    if scale >= 1.0:
+        return image
+    return cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+def grayscale(image):
+    if image.ndim == 2:
+        return image
+    return cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+
+def denoise(image, kernel=5):
+    kernel = int(kernel) | 1  # Kernel size must be odd
+    # Blur in place, the input buffer is already owned by the pipeline
+    return cv2.GaussianBlur(image, (kernel, kernel), 0, dst=image)
+
+def threshold(image, block_size=11, c=2):
+    image = grayscale(image)
+    return cv2.adaptiveThreshold(image, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                 cv2.THRESH_BINARY, int(block_size) | 1, float(c), dst=image)
+
+def deskew(image, max_angle=15):
+    """Rotate so that text lines are horizontal"""
+    gray = grayscale(image)
+    _, ink = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY_INV | cv2.THRESH_OTSU)
+    coords = cv2.findNonZero(ink)
+    if coords is None:
+        return image
+
+    # Take the angle of the rectangle's long edge from its corners: the angle minAreaRect
+    # reports is [-90, 0) before OpenCV 4.5 and (0, 90] after, relative to either edge
+    corners = cv2.boxPoints(cv2.minAreaRect(coords))
+    edges = [corners[(i + 1) % 4] - corners[i] for i in range(2)]
+    dx, dy = max(edges, key=lambda edge: edge[0] ** 2 + edge[1] ** 2)
+    angle = np.degrees(np.arctan2(dy, dx))
+    # Map to the smallest rotation, in (-90, 90] and then (-45, 45]
+    if angle > 90:
+        angle -= 180
+    elif angle <= -90:
+        angle += 180
+    if angle > 45:
+        angle -= 90
+    elif angle <= -45:
+        angle += 90
+    if abs(angle) < 0.5 or abs(angle) > float(max_angle):
+        return image
+
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(image, matrix, (width, height), flags=cv2.INTER_LINEAR,
+                          borderMode=cv2.BORDER_REPLICATE)
+
+# Registry of available steps, referenced by name in pipeline specs
+STEPS = {
+    'resize': resize_to_dpi,
+    'grayscale': grayscale,
+    'denoise': denoise,
+    'threshold': threshold,
+    'deskew': deskew
+}
+
+# Argument names and types of each step, in order; all must be positive except threshold's c
+STEP_ARGS = {
+    'resize': (('dpi', float),),
+    'grayscale': (),
+    'denoise': (('kernel', int),),
+    'threshold': (('block_size', int), ('c', float)),
+    'deskew': (('max_angle', float),)
+}
+
+# Steps that overwrite their input buffer
+IN_PLACE_STEPS = ('denoise', 'threshold')
+
+def parse_args(name, args):
+    """Convert a step's string arguments, raising ValueError for bad or extra ones"""
+    spec = STEP_ARGS[name]
+    if len(args) > len(spec):
+        raise ValueError(f'Preprocessing step {name} takes at most {len(spec)} argument(s)')
+    values = []
+    for (arg_name, convert), raw in zip(spec, args):
+        try:
+            value = convert(raw)
+        except ValueError:
+            raise ValueError(f'Invalid {arg_name} for preprocessing step {name}: {raw}')
+        if not math.isfinite(value):
+            raise ValueError(f'Invalid {arg_name} for preprocessing step {name}: {raw}')
+        if arg_name != 'c' and not value > 0:
+            raise ValueError(f'{arg_name} for preprocessing step {name} must be positive')
+        values.append(value)
+    return tuple(values)
+
+def parse_pipeline(spec):
+    """Parse "step:arg:arg,step" into an ordered list of (name, args) with converted args"""
+    steps = []
+    for item in (spec or '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, *args = item.split(':')
+        name = name.strip().lower()
+        if name not in STEPS:
+            raise ValueError(f'Unknown preprocessing step: {name}')
+        steps.append((name, parse_args(name, [arg.strip() for arg in args])))
+    return steps
+
+def pipeline_signature(steps):
+    """Canonical string for a parsed pipeline, used in cache keys"""
+    return ','.join(':'.join([name] + [f'{arg:g}' for arg in args]) for name, args in steps)
+
+def apply_pipeline(image, steps):
+    """Run the steps in order and return a NumPy array ready for OCR
+
+    A caller's array is never modified: it is copied only when an in-place step
+    would reach it before any other step has produced a new array.
+    """
+    owned = False
+    if isinstance(image, Image.Image):
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image = np.array(image)
+        owned = True
+    source = image
+
+    for name, args in steps:
+        if name in IN_PLACE_STEPS and not owned:
+            image = image.copy()
+            owned = True
+        image = STEPS[name](image, *args)
+        owned = owned or image is not source
+    return image
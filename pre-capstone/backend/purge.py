@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import argparse
+import threading
+from datetime import datetime
+
+from sqlalchemy import select, func
+
+from db_config import engine, init_db, VerificationRecord
+
+# Expired verification record purge
+PURGE_IN_PROCESS = os.getenv("PURGE_IN_PROCESS", "true").lower() in ('1', 'true', 'yes')
+PURGE_INTERVAL = float(os.getenv("PURGE_INTERVAL", "60"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "1000"))
+PURGE_MAX_BATCHES = int(os.getenv("PURGE_MAX_BATCHES", "100"))
+PURGE_PAUSE = float(os.getenv("PURGE_PAUSE", "0.05"))
+
+class ExpiryPurger:
+    """Deletes expired VerificationRecords in small chunks.
+
+    Each chunk is its own short transaction that deletes at most batch_size rows,
+    oldest expiry first, found through the expiry_time index; a short pause between
+    chunks lets request traffic in. One run stops after max_batches chunks and the
+    rest is picked up by the next run.
+    """
+
+    def __init__(self, bind=engine, batch_size=PURGE_BATCH_SIZE, max_batches=PURGE_MAX_BATCHES, pause=PURGE_PAUSE):
+        self.bind = bind
+        self.batch_size = max(1, batch_size)
+        self.max_batches = max(1, max_batches)
+        self.pause = pause
+
+        self._lock = threading.Lock()
+        self._schema_ready = False
+        self._metrics = {
+            'runs': 0,
+            'rows_purged_total': 0,
+            'last_run_rows': 0,
+            'last_run_at': None,
+            'last_run_seconds': 0.0,
+            'lag_seconds': 0.0,
+            'errors': 0,
+            'last_error': None
+        }
+
+    def ensure_schema(self):
+        """Create the table and its indexes, including expiry_time on existing tables"""
+        if not self._schema_ready:
+            init_db(self.bind)
+            self._schema_ready = True
+
+    def purge_chunk(self, now):
+        """Delete up to batch_size expired rows in one transaction and return how many went"""
+        table = VerificationRecord.__table__
+        expired_ids = (
+            select(table.c.id)
+            .where(table.c.expiry_time < now)
+            .order_by(table.c.expiry_time)
+            .limit(self.batch_size)
+        )
+        with self.bind.begin() as connection:
+            result = connection.execute(table.delete().where(table.c.id.in_(expired_ids)))
+        return result.rowcount
+
+    def lag(self, now):
+        """Seconds since the oldest expired row that is still in the table expired"""
+        table = VerificationRecord.__table__
+        with self.bind.connect() as connection:
+            oldest = connection.execute(
+                select(func.min(table.c.expiry_time)).where(table.c.expiry_time < now)
+            ).scalar()
+        return (now - oldest).total_seconds() if oldest else 0.0
+
+    def run(self):
+        """One purge pass; returns the number of rows deleted"""
+        # Overlapping runs would only contend for the same rows
+        if not self._lock.acquire(blocking=False):
+            return 0
+        started = time.perf_counter()
+        purged = 0
+        try:
+            self.ensure_schema()
+            now = datetime.utcnow()
+            for _ in range(self.max_batches):
+                deleted = self.purge_chunk(now)
+                purged += deleted
+                if deleted < self.batch_size:
+                    break
+                time.sleep(self.pause)
+
+            self._metrics['lag_seconds'] = round(self.lag(now), 3)
+        except Exception as e:
+            self._metrics['errors'] += 1
+            self._metrics['last_error'] = str(e)
+            print(f"Expired record purge failed: {e}")
+        finally:
+            self._metrics['runs'] += 1
+            self._metrics['rows_purged_total'] += purged
+            self._metrics['last_run_rows'] = purged
+            self._metrics['last_run_at'] = datetime.utcnow().isoformat()
+            self._metrics['last_run_seconds'] = round(time.perf_counter() - started, 3)
+            self._lock.release()
+        return purged
+
+    def stats(self):
+        return dict(self._metrics)
+
+# Shared purger instance
+purger = ExpiryPurger()
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def start_scheduler(interval=PURGE_INTERVAL, purge_records=True, jobs=None):
+    """Run the purge every interval seconds on an APScheduler background thread.
+
+    jobs maps job ids to extra callables run on the same interval; with purge_records
+    false only those run, for when purge.py deletes the records instead.
+    """
+    global _scheduler
+    # Checked again under the lock; this path runs on every request once started
+    if _scheduler is not None:
+        return _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            return _scheduler
+        from apscheduler.schedulers.background import BackgroundScheduler
+
+        scheduler = BackgroundScheduler(daemon=True)
+        if purge_records:
+            scheduler.add_job(purger.run, 'interval', seconds=interval, id='purge_expired_records',
+                              max_instances=1, coalesce=True)
+        for job_id, function in (jobs or {}).items():
+            scheduler.add_job(function, 'interval', seconds=interval, id=job_id, max_instances=1, coalesce=True)
+        scheduler.start()
+        _scheduler = scheduler
+        return _scheduler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Delete expired verification records')
+    parser.add_argument('--once', action='store_true', help='run a single purge pass and exit')
+    parser.add_argument('--interval', type=float, default=PURGE_INTERVAL, help='seconds between passes')
+    parser.add_argument('--batch-size', type=int, default=PURGE_BATCH_SIZE, help='rows deleted per transaction')
+    args = parser.parse_args(argv)
+
+    purger.batch_size = max(1, args.batch_size)
+    while True:
+        purged = purger.run()
+        stats = purger.stats()
+        print(f"Purged {purged} expired records in {stats['last_run_seconds']}s (lag {stats['lag_seconds']}s)")
+        if args.once:
+            return 1 if stats['last_error'] else 0
+        time.sleep(args.interval)
+
+if __name__ == '__main__':
+    sys.exit(main())
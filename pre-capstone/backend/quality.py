@@ -0,0 +1,117 @@
+import os
+import time
+
+import cv2
+
+from id_layout import find_card_quad, MIN_CARD_AREA_RATIO
+
+# Reject unusable photos before any OCR or face detection work
+QUALITY_GATE_ENABLED = os.getenv("QUALITY_GATE_ENABLED", "true").lower() in ('1', 'true', 'yes')
+
+# The checks run on a grayscale copy downscaled to this longest side, which also
+# keeps the sharpness score comparable between photo sizes
+QUALITY_MAX_DIMENSION = int(os.getenv("QUALITY_MAX_DIMENSION", "512"))
+
+# Variance of the Laplacian; sharp photos score in the tens or more, blurred ones in single digits
+QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "10"))
+# Mean brightness (0-255) outside this range is under- or overexposed
+QUALITY_MIN_BRIGHTNESS = float(os.getenv("QUALITY_MIN_BRIGHTNESS", "40"))
+QUALITY_MAX_BRIGHTNESS = float(os.getenv("QUALITY_MAX_BRIGHTNESS", "215"))
+# Fraction of blown-out pixels (250 and brighter) counted as glare
+QUALITY_MAX_GLARE = float(os.getenv("QUALITY_MAX_GLARE", "0.05"))
+# Shorter side of the decoded photo, in pixels
+QUALITY_MIN_RESOLUTION = int(os.getenv("QUALITY_MIN_RESOLUTION", "300"))
+# Fraction of the photo the ID card outline must cover (OCR only)
+QUALITY_MIN_CARD_FILL = float(os.getenv("QUALITY_MIN_CARD_FILL", str(MIN_CARD_AREA_RATIO)))
+
+# Card outlines smaller than this are not searched for at all
+CARD_SEARCH_MIN_AREA = 0.02
+
+GLARE_LEVEL = 250
+
+def _check(value, passed, threshold, reason, started):
+    return {
+        'value': None if value is None else round(float(value), 4),
+        'threshold': threshold,
+        'passed': bool(passed),
+        'reason': None if passed else reason,
+        'ms': round((time.perf_counter() - started) * 1000, 3)
+    }
+
+def check_resolution(image, gray):
+    started = time.perf_counter()
+    shorter = min(image.shape[:2])
+    return _check(shorter, shorter >= QUALITY_MIN_RESOLUTION, QUALITY_MIN_RESOLUTION, 'low_resolution', started)
+
+def check_sharpness(image, gray):
+    started = time.perf_counter()
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    return _check(sharpness, sharpness >= QUALITY_MIN_SHARPNESS, QUALITY_MIN_SHARPNESS, 'blurry', started)
+
+def check_exposure(image, gray):
+    started = time.perf_counter()
+    brightness = gray.mean()
+    reason = 'too_dark' if brightness < QUALITY_MIN_BRIGHTNESS else 'overexposed'
+    passed = QUALITY_MIN_BRIGHTNESS <= brightness <= QUALITY_MAX_BRIGHTNESS
+    return _check(brightness, passed, [QUALITY_MIN_BRIGHTNESS, QUALITY_MAX_BRIGHTNESS], reason, started)
+
+def check_glare(image, gray):
+    started = time.perf_counter()
+    histogram = cv2.calcHist([gray], [0], None, [256], [0, 256]).ravel()
+    glare = histogram[GLARE_LEVEL:].sum() / gray.size
+    return _check(glare, glare <= QUALITY_MAX_GLARE, QUALITY_MAX_GLARE, 'glare', started)
+
+def check_card_fill(image, gray):
+    """Area of the card outline over the photo area; passes when no outline is found,
+    since cropped cards and photos without clear edges cannot be judged"""
+    started = time.perf_counter()
+    corners = find_card_quad(gray, min_area_ratio=CARD_SEARCH_MIN_AREA)
+    if corners is None:
+        return _check(None, True, QUALITY_MIN_CARD_FILL, 'card_too_small', started)
+    fill = cv2.contourArea(corners) / gray.size
+    return _check(fill, fill >= QUALITY_MIN_CARD_FILL, QUALITY_MIN_CARD_FILL, 'card_too_small', started)
+
+# Cheapest first
+CHECKS = {
+    'resolution': check_resolution,
+    'exposure': check_exposure,
+    'glare': check_glare,
+    'sharpness': check_sharpness,
+    'card_fill': check_card_fill
+}
+
+# Face photos are not expected to contain a card
+FACIAL_CHECKS = ('resolution', 'exposure', 'glare', 'sharpness')
+
+def assess_quality(image, checks=None):
+    """Run the quality checks on a decoded RGB array.
+
+    Returns {'passed', 'reasons', 'checks', 'ms'} where every check reports its
+    value, threshold and timing.
+    """
+    started = time.perf_counter()
+    # Shrink first so the colour conversion only touches the small copy
+    small = image
+    scale = min(1.0, QUALITY_MAX_DIMENSION / max(image.shape[:2]))
+    if scale < 1.0:
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_RGB2GRAY) if small.ndim == 3 else small
+
+    results = {name: CHECKS[name](image, gray) for name in (checks or CHECKS)}
+    reasons = [result['reason'] for result in results.values() if not result['passed']]
+    return {
+        'passed': not reasons,
+        'reasons': reasons,
+        'checks': results,
+        'ms': round((time.perf_counter() - started) * 1000, 3)
+    }
+
+def rejection(report):
+    """Structured failure result for a photo that did not pass assess_quality"""
+    return {
+        'success': False,
+        'rejected': True,
+        'error': 'Image quality too low: ' + ', '.join(report['reasons']).replace('_', ' '),
+        'reasons': report['reasons'],
+        'quality': report
+    }
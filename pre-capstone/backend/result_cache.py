@@ -0,0 +1,214 @@
+import os
+import json
+import base64
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from cryptography.fernet import InvalidToken
+
+from db_config import encrypt_data, decrypt_data
+
+# Bump whenever OCR or face processing changes in a way that alters results
+PIPELINE_VERSION = "5"
+
+# Cache configuration
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "600"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "")
+
+def encode_bytes(value):
+    # Raw bytes in a result (the annotated JPEG) are only base64-encoded for the disk cache
+    if isinstance(value, bytes):
+        return {'__bytes__': base64.b64encode(value).decode('ascii')}
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+def decode_bytes(value):
+    if set(value) == {'__bytes__'}:
+        return base64.b64decode(value['__bytes__'])
+    return value
+
+def result_size(result):
+    """Approximate size of a result in bytes, counting raw bytes at their length"""
+    blobs = []
+
+    def measure(value):
+        if isinstance(value, bytes):
+            blobs.append(len(value))
+            return None
+        raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+    return len(json.dumps(result, default=measure)) + sum(blobs)
+
+def make_key(image_hash, processing_type, variant=''):
+    """Build a cache key from the image hash, processing type and pipeline version"""
+    return f"{PIPELINE_VERSION}:{processing_type}:{variant}:{image_hash}"
+
+class DiskCacheBackend:
+    """Encrypted on-disk cache entries that survive restarts"""
+
+    def __init__(self, directory, max_bytes, ttl):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._files = OrderedDict()  # file name -> size, oldest first
+        self._total_bytes = 0
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # Rebuild the index from whatever is already on disk
+        entries = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith('.bin') and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(entries):
+            self._files[name] = size
+            self._total_bytes += size
+
+    def _file_name(self, key):
+        return hashlib.sha256(key.encode()).hexdigest() + '.bin'
+
+    def _remove(self, name):
+        size = self._files.pop(name, 0)
+        self._total_bytes -= size
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            pass
+
+    def get(self, key):
+        name = self._file_name(key)
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            if name not in self._files:
+                return None
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                self._remove(name)
+                return None
+            with open(path, 'rb') as f:
+                token = f.read()
+
+        try:
+            return json.loads(decrypt_data(token), object_hook=decode_bytes)
+        except (InvalidToken, ValueError):
+            # Written with a different encryption key or corrupted
+            with self._lock:
+                self._remove(name)
+            return None
+
+    def set(self, key, payload):
+        name = self._file_name(key)
+        token = encrypt_data(payload)
+        path = os.path.join(self.directory, name)
+        with self._lock:
+            if name in self._files:
+                self._remove(name)
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.write(token)
+            os.replace(tmp_path, path)
+            self._files[name] = len(token)
+            self._total_bytes += len(token)
+
+            while self._total_bytes > self.max_bytes and self._files:
+                self._remove(next(iter(self._files)))
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._files), 'bytes': self._total_bytes}
+
+class ResultCache:
+    """LRU cache of processing results with a TTL and a size bound in bytes"""
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, ttl=RESULT_CACHE_TTL, cache_dir=RESULT_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk = DiskCacheBackend(cache_dir, max_bytes, ttl) if cache_dir else None
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, size, result)
+        self._total_bytes = 0
+        self._counters = {
+            'hits': 0,
+            'misses': 0,
+            'disk_hits': 0,
+            'evictions': 0,
+            'expirations': 0
+        }
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._total_bytes -= size
+
+    def _store(self, key, result, size):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (time.monotonic() + self.ttl, size, result)
+        self._total_bytes += size
+
+        # Evict least recently used entries until we are back under budget
+        while self._total_bytes > self.max_bytes and self._entries:
+            self._remove(next(iter(self._entries)))
+            self._counters['evictions'] += 1
+
+    def get(self, key):
+        """Return the cached result for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] < time.monotonic():
+                    self._remove(key)
+                    self._counters['expirations'] += 1
+                else:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return entry[2]
+
+        if self.disk is not None:
+            result = self.disk.get(key)
+            if result is not None:
+                size = result_size(result)
+                with self._lock:
+                    self._counters['hits'] += 1
+                    self._counters['disk_hits'] += 1
+                    if size <= self.max_bytes:
+                        self._store(key, result, size)
+                return result
+
+        with self._lock:
+            self._counters['misses'] += 1
+        return None
+
+    def set(self, key, result):
+        """Cache a result; entries larger than the whole budget are skipped"""
+        size = result_size(result)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._store(key, result, size)
+
+        if self.disk is not None:
+            self.disk.set(key, json.dumps(result, default=encode_bytes))
+
+    def stats(self):
+        """Return hit/miss counters and current usage"""
+        with self._lock:
+            snapshot = dict(self._counters)
+            snapshot.update({
+                'entries': len(self._entries),
+                'bytes': self._total_bytes,
+                'max_bytes': self.max_bytes,
+                'ttl_seconds': self.ttl
+            })
+        if self.disk is not None:
+            snapshot['disk'] = self.disk.stats()
+        return snapshot
+
+# Shared cache used by the Flask app
+result_cache = ResultCache()
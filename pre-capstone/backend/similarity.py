@@ -0,0 +1,130 @@
+import numpy as np
+
+def _myers_distance(pattern, text):
+    """Levenshtein distance with Myers' bit-parallel algorithm (Hyyrö's formulation).
+
+    Each column of the DP matrix is kept as bit vectors of vertical +1/-1 deltas,
+    so memory is one integer per distinct character of the shorter string.
+    """
+    m = len(pattern)
+    full = (1 << m) - 1
+    last_bit = 1 << (m - 1)
+
+    peq = {}
+    for i, char in enumerate(pattern):
+        peq[char] = peq.get(char, 0) | (1 << i)
+
+    pv = full
+    mv = 0
+    score = m
+    for char in text:
+        eq = peq.get(char, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & full
+        mh = pv & xh
+        if ph & last_bit:
+            score += 1
+        elif mh & last_bit:
+            score -= 1
+        ph = ((ph << 1) | 1) & full
+        mh = (mh << 1) & full
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv
+    return score
+
+def _bounded_distance(short, long, max_distance):
+    """Two-row Levenshtein that gives up once the distance must exceed max_distance.
+
+    Returns the exact distance, or None when it is larger than max_distance.
+    """
+    previous = list(range(len(short) + 1))
+    for j, long_char in enumerate(long, 1):
+        current = [j]
+        row_min = j
+        for i, short_char in enumerate(short, 1):
+            value = min(
+                previous[i] + 1,                                  # deletion
+                current[i - 1] + 1,                               # insertion
+                previous[i - 1] + (short_char != long_char)       # substitution
+            )
+            current.append(value)
+            if value < row_min:
+                row_min = value
+        # Distances along a row never shrink below the row minimum afterwards
+        if row_min > max_distance:
+            return None
+        previous = current
+    distance = previous[-1]
+    return distance if distance <= max_distance else None
+
+def levenshtein_distance(str1, str2, max_distance=None):
+    """Edit distance between two strings, or None when it exceeds max_distance"""
+    short, long = (str1, str2) if len(str1) <= len(str2) else (str2, str1)
+    if max_distance is not None:
+        if len(long) - len(short) > max_distance:
+            return None
+        return _bounded_distance(short, long, max_distance)
+    if not short:
+        return len(long)
+    return _myers_distance(short, long)
+
+def similarity_score(str1, str2, threshold=None):
+    """Improved string similarity score between 0 and 1 using Levenshtein distance
+
+    With a threshold, comparisons stop as soon as the score can no longer reach it
+    and 0.0 is returned for them; scores at or above the threshold are exact.
+    """
+    if not str1 or not str2:
+        return 0
+
+    max_len = max(len(str1), len(str2))
+    if threshold is None:
+        return 1.0 - (levenshtein_distance(str1, str2) / max_len)
+
+    max_distance = int((1.0 - threshold) * max_len + 1e-9)
+    distance = levenshtein_distance(str1, str2, max_distance=max_distance)
+    if distance is None:
+        return 0.0
+    score = 1.0 - (distance / max_len)
+    return score if score >= threshold else 0.0
+
+def batch_similarity(query, candidates):
+    """Score one string against many candidates at once with NumPy.
+
+    Runs the Levenshtein DP for all candidates together, one query character
+    per step, and returns a float array with the same scores as similarity_score.
+    """
+    count = len(candidates)
+    if count == 0:
+        return np.zeros(0, dtype=np.float64)
+    if not query:
+        return np.zeros(count, dtype=np.float64)
+
+    lengths = np.fromiter((len(candidate) for candidate in candidates), dtype=np.int64, count=count)
+    width = int(lengths.max())
+
+    # Code points padded with -1, which never equals a query character
+    codes = np.full((count, width), -1, dtype=np.int64)
+    for row, candidate in enumerate(candidates):
+        codes[row, :len(candidate)] = [ord(char) for char in candidate]
+
+    offsets = np.arange(width + 1, dtype=np.int64)
+    previous = np.broadcast_to(offsets, (count, width + 1)).copy()
+    current = np.empty_like(previous)
+
+    for i, char in enumerate(query, 1):
+        mismatch = codes != ord(char)
+        current[:, 0] = i
+        np.minimum(previous[:, :-1] + mismatch, previous[:, 1:] + 1, out=current[:, 1:])
+        # Insertions: current[j] = min over k <= j of current[k] + (j - k)
+        current -= offsets
+        np.minimum.accumulate(current, axis=1, out=current)
+        current += offsets
+        previous, current = current, previous
+
+    distances = previous[np.arange(count), lengths]
+    max_lens = np.maximum(lengths, len(query))
+    scores = 1.0 - distances / np.maximum(max_lens, 1)
+    scores[lengths == 0] = 0.0
+    return scores
@@ -0,0 +1,199 @@
+# Checks that the ghana_card FieldExtractor gives exactly the fields of the
+# extract_id_card_data code it replaced, on a fixed corpus. Run with:
+#   python -m unittest test_field_extractor_equivalence
+import re
+import random
+import unittest
+
+from field_extractor import EXTRACTORS
+
+def reference_extract_id_card_data(text):
+    """The line-by-line extract_id_card_data replaced by the ghana_card FieldExtractor (debug prints removed)"""
+    data = {
+        'firstName': None,
+        'lastName': None,
+        'id_number': None,
+        'nationality': None,
+        'sex': None
+    }
+
+    text_lines = [line.strip() for line in text.split('\n') if line.strip()]
+
+    for line in text_lines:
+        if re.match(r'^[A-Z]+$', line) and len(line) > 1:
+            data['lastName'] = line
+            break
+
+    for i, line in enumerate(text_lines):
+        if re.match(r'^[A-Z]+(\s[A-Z]+)*$', line) and len(line) > 1:
+            if line != data['lastName']:
+                name_parts = line.split()
+                if name_parts:
+                    data['firstName'] = name_parts[0]
+                break
+
+    if not data['firstName']:
+        name_labels = ['Firstname', 'Prénoms', 'First name', 'Given name', 'Name']
+        for i, line in enumerate(text_lines):
+            if any(label in line for label in name_labels):
+                for j in range(i+1, min(i+3, len(text_lines))):
+                    if j < len(text_lines) and re.match(r'^[A-Z]+(\s[A-Z]+)*$', text_lines[j]) and len(text_lines[j]) > 1:
+                        name_parts = text_lines[j].split()
+                        if name_parts:
+                            data['firstName'] = name_parts[0]
+                        break
+                if data['firstName']:
+                    break
+
+    id_patterns = [
+        r'(GHA[-\s]?\d+[-\s]?\d*)',
+        r'(ID[-\s:]?\d+[-\s]?\d*)',
+        r'(\d{9,})'
+    ]
+
+    for line in text_lines:
+        for pattern in id_patterns:
+            id_match = re.search(pattern, line)
+            if id_match:
+                data['id_number'] = id_match.group(1).replace(' ', '')
+                break
+        if data['id_number']:
+            break
+
+    nationality_labels = ['Nationality', 'Nation', 'Citizen', 'Citizenship']
+
+    for i, line in enumerate(text_lines):
+        if any(label.lower() in line.lower() for label in nationality_labels):
+            if 'ghanaian' in line.lower():
+                data['nationality'] = 'Ghanaian'
+                break
+            elif 'ghana' in line.lower():
+                data['nationality'] = 'Ghanaian'
+                break
+
+            if not data['nationality'] and i+1 < len(text_lines):
+                next_line = text_lines[i+1].lower()
+                if 'ghanaian' in next_line:
+                    data['nationality'] = 'Ghanaian'
+                    break
+                elif 'ghana' in next_line:
+                    data['nationality'] = 'Ghanaian'
+                    break
+
+            if not data['nationality'] and i+1 < len(text_lines):
+                next_line = text_lines[i+1]
+                words = next_line.split()
+                for word in words:
+                    if word[0].isupper() and len(word) > 2 and word.lower() not in ['the', 'and', 'for', 'with']:
+                        if word.lower() == 'ghana':
+                            data['nationality'] = 'Ghanaian'
+                        else:
+                            data['nationality'] = word
+                        break
+
+            if data['nationality']:
+                break
+
+    if not data['nationality']:
+        for line in text_lines:
+            line_lower = line.lower()
+            if 'ghanaian' in line_lower:
+                data['nationality'] = 'Ghanaian'
+                break
+            elif 'ghana' in line_lower and 'ghanaian' not in line_lower:
+                data['nationality'] = 'Ghanaian'
+                break
+
+    gender_labels = ['Sex', 'Gender', 'Male', 'Female', 'M', 'F']
+
+    for i, line in enumerate(text_lines):
+        line_lower = line.lower()
+
+        if any(label.lower() in line_lower for label in gender_labels[:2]):
+            if 'male' in line_lower and 'female' not in line_lower:
+                data['sex'] = 'Male'
+                break
+            elif 'female' in line_lower:
+                data['sex'] = 'Female'
+                break
+            elif ' m ' in f' {line_lower} ' or line_lower.endswith(' m'):
+                data['sex'] = 'Male'
+                break
+            elif ' f ' in f' {line_lower} ' or line_lower.endswith(' f'):
+                data['sex'] = 'Female'
+                break
+
+            if not data['sex'] and i+1 < len(text_lines):
+                next_line = text_lines[i+1].lower()
+                if 'male' in next_line and 'female' not in next_line:
+                    data['sex'] = 'Male'
+                    break
+                elif 'female' in next_line:
+                    data['sex'] = 'Female'
+                    break
+                elif next_line.strip() == 'm':
+                    data['sex'] = 'Male'
+                    break
+                elif next_line.strip() == 'f':
+                    data['sex'] = 'Female'
+                    break
+
+        elif line_lower.strip() == 'male' or line_lower.strip() == 'm':
+            data['sex'] = 'Male'
+            break
+        elif line_lower.strip() == 'female' or line_lower.strip() == 'f':
+            data['sex'] = 'Female'
+            break
+
+    if not data['sex']:
+        for line in text_lines:
+            line_lower = line.lower()
+            if re.search(r'\bmale\b', line_lower) and not re.search(r'\bfemale\b', line_lower):
+                data['sex'] = 'Male'
+                break
+            elif re.search(r'\bfemale\b', line_lower):
+                data['sex'] = 'Female'
+                break
+            elif re.search(r'\bm\b', line_lower) and not re.search(r'\bf\b', line_lower):
+                data['sex'] = 'Male'
+                break
+            elif re.search(r'\bf\b', line_lower):
+                data['sex'] = 'Female'
+                break
+
+    return data
+
+# OCR texts: the sample card, label variations, and noise the heuristics must not trip on
+OCR_TEXTS = [
+    "REPUBLIC OF GHANA\nECOWAS IDENTITY CARD\nSurname/Nom\nKING\nFirstnames/Prénoms\nDARRYL LAUD ABOAGYE\n"
+    "Nationality/Nationalité\nGHANAIAN\nSex/Sexe\nM\nPersonal ID Number\nGHA-719819958-0\n",
+    "Surname\nMENSAH\nFirst name\nAma Serwaa\nGiven name\nAMA SERWAA\nCitizenship: Ghana\nGender: female\nID: 123456789\n",
+    "NAME\nKWAME\nNation\nNigerian Citizen\nSex\nf\nGHA 123 4\n",
+    "the citizen of\nthe Kenya republic\nmale\n",
+    "Sex M\nNationality\n",
+    "\n\n   \n",
+    "ID-42 and 1234567890\nGender\nM\nfemale doctor\n",
+    "Citizen\nghana\nF\n"
+]
+
+LINE_POOL = [
+    'REPUBLIC OF GHANA', 'ECOWAS IDENTITY CARD', 'Surname/Nom', 'KING', 'MENSAH', 'Firstnames/Prénoms',
+    'DARRYL LAUD ABOAGYE', 'Ama Serwaa', 'Given name', 'Name:', 'Nationality/Nationalité', 'GHANAIAN',
+    'Ghana', 'Nigerian', 'Citizenship Kenyan', 'the and for', 'Sex/Sexe', 'Gender', 'M', 'F', 'm', 'f',
+    'male', 'Female', 'Sex: M', 'Sex f', 'Personal ID Number', 'GHA-719819958-0', 'GHA 123456789 1',
+    'ID:987654', '123456789012', 'Date of Birth 09/07/2003', '', '   ', 'x', 'A', 'a m b', 'Place of Issuance ACCRA'
+]
+
+def random_ocr_texts(count, seed=1234):
+    generator = random.Random(seed)
+    return ['\n'.join(generator.choice(LINE_POOL) for _ in range(generator.randint(0, 12))) for _ in range(count)]
+
+class FieldExtractorEquivalenceTest(unittest.TestCase):
+    def test_ghana_card_matches_reference(self):
+        extractor = EXTRACTORS['ghana_card']
+        for text in OCR_TEXTS + random_ocr_texts(3000):
+            with self.subTest(text=text):
+                self.assertEqual(extractor.extract(text), reference_extract_id_card_data(text))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+# Checks that similarity.py gives exactly the scores of the Levenshtein code it
+# replaced, on a fixed corpus. Run with:
+#   python -m unittest test_similarity_equivalence
+import random
+import unittest
+
+from similarity import similarity_score, batch_similarity
+
+def reference_similarity_score(str1, str2):
+    """The list-of-lists Levenshtein similarity_score replaced by similarity.py"""
+    if not str1 or not str2:
+        return 0
+
+    m, n = len(str1), len(str2)
+    d = [[0 for _ in range(n+1)] for _ in range(m+1)]
+
+    for i in range(m+1):
+        d[i][0] = i
+    for j in range(n+1):
+        d[0][j] = j
+
+    for j in range(1, n+1):
+        for i in range(1, m+1):
+            if str1[i-1] == str2[j-1]:
+                d[i][j] = d[i-1][j-1]
+            else:
+                d[i][j] = min(
+                    d[i-1][j] + 1,
+                    d[i][j-1] + 1,
+                    d[i-1][j-1] + 1
+                )
+
+    max_len = max(m, n)
+    if max_len == 0:
+        return 1.0
+    return 1.0 - (d[m][n] / max_len)
+
+# Hand-picked pairs: empty strings, identical, prefixes, transpositions, unicode, long names
+SIMILARITY_PAIRS = [
+    ('', ''), ('', 'a'), ('a', ''), ('a', 'a'), ('a', 'b'), ('ab', 'ba'),
+    ('darryl', 'darryl'), ('darryl', 'daryl'), ('king', 'kin'), ('aboagye', 'aboagey'),
+    ('ghanaian', 'ghana'), ('kitten', 'sitting'), ('flaw', 'lawn'), ('prénoms', 'prenoms'),
+    ('gha719819958', 'gha719819959'), ('darryl laud aboagye', 'darryl aboagye'),
+    ('x' * 70, 'x' * 69 + 'y'), ('ab' * 40, 'ba' * 40)
+]
+
+def random_pairs(count, seed=4321):
+    generator = random.Random(seed)
+    alphabet = 'abcde GHA0123456789'
+    word = lambda: ''.join(generator.choice(alphabet) for _ in range(generator.randint(0, 20)))
+    return [(word(), word()) for _ in range(count)]
+
+class SimilarityEquivalenceTest(unittest.TestCase):
+    def test_scores_match_reference(self):
+        for str1, str2 in SIMILARITY_PAIRS + random_pairs(3000):
+            with self.subTest(str1=str1, str2=str2):
+                self.assertEqual(similarity_score(str1, str2), reference_similarity_score(str1, str2))
+
+    def test_threshold_scores_are_exact_above_the_threshold(self):
+        for str1, str2 in SIMILARITY_PAIRS + random_pairs(1000):
+            expected = reference_similarity_score(str1, str2)
+            for threshold in (0.0, 0.5, 0.6, 0.8, 1.0):
+                with self.subTest(str1=str1, str2=str2, threshold=threshold):
+                    self.assertEqual(similarity_score(str1, str2, threshold), expected if expected >= threshold else 0.0)
+
+    def test_batch_matches_reference(self):
+        pairs = SIMILARITY_PAIRS + random_pairs(500)
+        candidates = [str2 for _, str2 in pairs]
+        for query in ('', 'darryl', 'gha719819958', 'ab' * 40):
+            scores = batch_similarity(query, candidates)
+            self.assertEqual(list(scores), [float(reference_similarity_score(query, candidate)) for candidate in candidates])
+
+if __name__ == '__main__':
+    unittest.main()
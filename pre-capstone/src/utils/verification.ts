@@ -1,10 +1,39 @@
 import axios from 'axios';
 import { IFormData, VerificationData } from '../types';
 
-const processImage = async (file: File, type: 'ocr' | 'facial') => {
+// Advice for each reason the backend's quality gate can give
+const QUALITY_ADVICE: Record<string, string> = {
+  blurry: 'Hold the camera steady and make sure the photo is in focus',
+  too_dark: 'Take the photo in better light',
+  overexposed: 'Avoid direct light or flash on the photo',
+  glare: 'Tilt the card slightly to avoid reflections',
+  low_resolution: 'Use a higher resolution photo',
+  card_too_small: 'Move closer so the card fills more of the photo'
+};
+
+// Thrown when /process-image turns a photo away before processing it
+export class ImageQualityError extends Error {
+  reasons: string[];
+
+  constructor(message: string, reasons: string[]) {
+    super(message);
+    this.name = 'ImageQualityError';
+    this.reasons = reasons;
+  }
+
+  get advice(): string[] {
+    return this.reasons.map((reason) => QUALITY_ADVICE[reason] || reason);
+  }
+}
+
+const processImage = async (file: File, type: 'ocr' | 'facial', encodePortrait = false) => {
   const formData = new FormData();
   formData.append('image', file);
   formData.append('type', type);
+  if (encodePortrait) {
+    // The backend also caches the card portrait's face encoding under the returned image_hash
+    formData.append('encode_portrait', 'true');
+  }
 
   try {
     const response = await axios.post('http://localhost:5000/process-image', formData, {
@@ -14,28 +43,62 @@ const processImage = async (file: File, type: 'ocr' | 'facial') => {
     });
     return response.data;
   } catch (error) {
+    // Unusable photos are rejected with a 422 listing the reasons
+    if (axios.isAxiosError(error) && error.response?.status === 422) {
+      const { error: message, reasons } = error.response.data;
+      throw new ImageQualityError(message || 'Image quality too low', reasons || []);
+    }
     throw new Error('Image processing failed');
   }
 };
 
+const matchFaces = async (idCardFile: File, selfieFile: File, idCardHash?: string) => {
+  const formData = new FormData();
+  // With the hash from the OCR request the ID card is not uploaded a second time
+  if (idCardHash) {
+    formData.append('id_card_hash', idCardHash);
+  } else {
+    formData.append('id_card', idCardFile);
+  }
+  formData.append('selfie', selfieFile);
+
+  try {
+    const response = await axios.post('http://localhost:5000/match-faces', formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    });
+    return response.data;
+  } catch (error) {
+    // The cached encoding can expire; the server then asks for the image itself
+    if (idCardHash && axios.isAxiosError(error) && error.response?.status === 404) {
+      return matchFaces(idCardFile, selfieFile);
+    }
+    console.error('Face matching failed:', error);
+    return { success: false, error: 'Face matching failed' };
+  }
+};
+
 export const verifyDocuments = async (idCardFile: File, selfieFile: File, formData: IFormData): Promise<{
   ocrResult: any;
-  faceResult: any;
+  faceMatch: any;
   dataVerification: any;
 }> => {
-  // Process images
-  const [ocrResult, faceResult] = await Promise.all([
-    processImage(idCardFile, 'ocr'),
-    processImage(selfieFile, 'facial')
-  ]);
+  // OCR the ID card first: the same request caches its portrait encoding, so /match-faces
+  // gets the card's hash and only the selfie is uploaded there. Each image is sent once.
+  const ocrResult = await processImage(idCardFile, 'ocr', true);
+  const faceMatch = await matchFaces(idCardFile, selfieFile, ocrResult.image_hash);
   
   // If OCR was successful, verify the extracted data against form data
   let dataVerification = null;
   if (ocrResult.success && ocrResult.data.extracted) {
     try {
+      // The image hashes let the backend store the record with the selfie's face encoding
       const verifyResponse = await axios.post('http://localhost:5000/verify-id-data', {
         formData,
-        ocrData: ocrResult.data.extracted
+        ocrData: ocrResult.data.extracted,
+        idCardHash: faceMatch?.data?.hashes?.id_card,
+        selfieHash: faceMatch?.data?.hashes?.selfie
       });
       dataVerification = verifyResponse.data;
     } catch (error) {
@@ -43,7 +106,7 @@ export const verifyDocuments = async (idCardFile: File, selfieFile: File, formDa
     }
   }
 
-  return { ocrResult, faceResult, dataVerification };
+  return { ocrResult, faceMatch, dataVerification };
 };
 
 export const simulateVerification = async (data: IFormData): Promise<VerificationData> => {
@@ -52,13 +115,13 @@ export const simulateVerification = async (data: IFormData): Promise<Verificatio
       throw new Error('Both ID card and selfie are required');
     }
 
-    const { ocrResult, faceResult, dataVerification } = await verifyDocuments(
+    const { ocrResult, faceMatch, dataVerification } = await verifyDocuments(
       data.idCardFile, 
       data.selfieFile,
       data
     );
     
-    if (!ocrResult.success || !faceResult.success) {
+    if (!ocrResult.success) {
       return {
         success: false,
         message: "Verification failed",
@@ -69,8 +132,9 @@ export const simulateVerification = async (data: IFormData): Promise<Verificatio
       };
     }
 
-    // Simulate face matching confidence
-    const faceMatchScore = Math.random();
+    // Face matching confidence from the backend's ID portrait vs selfie comparison
+    const faceMatchScore: number = faceMatch?.success ? faceMatch.data.confidence : 0;
+    const faceMatched: boolean = Boolean(faceMatch?.success && faceMatch.data.match);
     
     // Check data verification results
     const dataMatchFailed = dataVerification && 
@@ -84,7 +148,10 @@ export const simulateVerification = async (data: IFormData): Promise<Verificatio
     // Add facial recognition details
     facialDetails.push(`Face matching confidence: ${(faceMatchScore * 100).toFixed(1)}%`);
     
-    if (faceMatchScore < 0.7) {
+    if (!faceMatch?.success) {
+      facialDetails.push(faceMatch?.error || "Face matching failed");
+      facialDetails.push("Please try again with a clearer selfie photo");
+    } else if (!faceMatched) {
       facialDetails.push("Face matching below threshold");
       facialDetails.push("Please try again with a clearer selfie photo");
     } else {
@@ -115,7 +182,7 @@ export const simulateVerification = async (data: IFormData): Promise<Verificatio
     }
     
     // Determine overall success
-    const overallSuccess = faceMatchScore >= 0.7 && !dataMatchFailed;
+    const overallSuccess = faceMatched && !dataMatchFailed;
     
     return {
       success: overallSuccess,
@@ -126,6 +193,13 @@ export const simulateVerification = async (data: IFormData): Promise<Verificatio
       confidence: (faceMatchScore + (dataVerification?.data?.confidence || 0)) / 2 // Average of both scores
     };
   } catch (error) {
+    if (error instanceof ImageQualityError) {
+      return {
+        success: false,
+        message: "Verification failed",
+        details: [error.message, ...error.advice]
+      };
+    }
     return {
       success: false,
       message: "Verification failed",